@@ -0,0 +1,149 @@
+"""Anonymization of medical report text: regex rules plus selective spaCy NER."""
+from bisect import bisect_right
+from functools import lru_cache
+
+import spacy
+
+from medical_lexicon import SpanIndex, default_lexicon
+from redaction_rules import (
+    MEDICAL_CONTEXT_RE, MEDICAL_PREFIX_RE, MEDICINE_PATTERNS, NLP_MODEL, POST_NER_RULES, PRE_NER_RULES
+)
+
+
+@lru_cache(maxsize=1)
+def get_nlp():
+    """spaCy English NER model, loaded once per process"""
+    return spacy.load(NLP_MODEL)
+
+
+class TrackedText:
+    """Text being redacted that remembers where every replacement came from.
+
+    Pieces are (start, end, original_start, original_end, label) runs of the
+    current text; label is None for untouched original text.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.pieces = [(0, len(text), 0, len(text), None)]
+
+    def _original_offset(self, starts, pos, at_end):
+        index = max(0, bisect_right(starts, pos) - 1)
+        if at_end and index and starts[index] == pos:
+            index -= 1
+        start, end, original_start, original_end, label = self.pieces[index]
+        if label is None:
+            return original_start + min(pos, end) - start
+        return original_end if at_end else original_start
+
+    def substitute(self, matches):
+        """Apply sorted, non-overlapping (start, end, replacement, label) replacements"""
+        matches = list(matches)
+        if not matches:
+            return
+        starts = [piece[0] for piece in self.pieces]
+        text_parts, pieces = [], []
+        length = cursor = index = 0
+        for start, end, replacement, label in matches + [(len(self.text), len(self.text), None, None)]:
+            # The untouched stretch before the match keeps its pieces, shifted
+            shift = length - cursor
+            while index < len(self.pieces) and self.pieces[index][0] < start:
+                piece_start, piece_end, original_start, original_end, piece_label = self.pieces[index]
+                low, high = max(piece_start, cursor), min(piece_end, start)
+                if low < high:
+                    if piece_label is None:
+                        pieces.append((low + shift, high + shift, original_start + low - piece_start,
+                                       original_start + high - piece_start, None))
+                    else:
+                        pieces.append((low + shift, high + shift, original_start, original_end, piece_label))
+                if piece_end > start:
+                    break
+                index += 1
+            text_parts.append(self.text[cursor:start])
+            length += start - cursor
+            if replacement is None:
+                break
+            pieces.append((length, length + len(replacement), self._original_offset(starts, start, False),
+                           self._original_offset(starts, end, True), label))
+            text_parts.append(replacement)
+            length += len(replacement)
+            cursor = end
+            # Pieces inside the match are absorbed by it
+            while index < len(self.pieces) and self.pieces[index][1] <= end:
+                index += 1
+        self.text = "".join(text_parts)
+        self.pieces = pieces
+
+    def apply_rules(self, rules):
+        """Same result as redaction_rules.apply_rules, with the replacements tracked"""
+        for name, pattern, replacement in rules:
+            self.substitute((m.start(), m.end(), replacement, name) for m in pattern.finditer(self.text))
+
+    def replace(self, old, new, label):
+        """Same result as str.replace, with the replacements tracked"""
+        matches, start = [], self.text.find(old)
+        while old and start != -1:
+            matches.append((start, start + len(old), new, label))
+            start = self.text.find(old, start + len(old))
+        self.substitute(matches)
+
+    def spans(self):
+        """Every replacement as {label, start, end} in the original and {redacted_start, redacted_end}"""
+        return [
+            {"label": label, "start": original_start, "end": original_end,
+             "redacted_start": start, "redacted_end": end}
+            for start, end, original_start, original_end, label in self.pieces if label is not None
+        ]
+
+
+def clean_sensitive_info(text):
+    return redact(text)[0]
+
+
+def redact(text):
+    """Anonymize `text`; returns (redacted text, span map from TrackedText.spans)"""
+    tracked = TrackedText(text)
+
+    # --- Remove phones, emails, websites and explicitly titled names ---
+    tracked.apply_rules(PRE_NER_RULES)
+    text = tracked.text
+    
+    # --- Use spaCy NER but be very selective ---
+    doc = get_nlp()(text)
+    
+    # Find every medical term once over the whole document, so each entity
+    # below is checked with O(1) span lookups instead of re-scanning the text
+    lowered = doc.text.lower()
+    medical_spans = SpanIndex(len(doc.text))
+    medical_spans.add_all(default_lexicon().find_spans(doc.text))
+    for pattern in MEDICINE_PATTERNS:
+        medical_spans.add_all(m.span() for m in pattern.finditer(doc.text))
+    
+    # Medical words within 20 characters of an entity
+    for m in MEDICAL_CONTEXT_RE.finditer(lowered):
+        medical_spans.add(m.start() - 20, m.end() + 20)
+    
+    # Medication prefixes ending within 10 characters before an entity
+    prefix_spans = SpanIndex(len(doc.text))
+    for m in MEDICAL_PREFIX_RE.finditer(lowered):
+        prefix_spans.add(m.end(), m.start() + 11)
+    
+    for ent in doc.ents:
+        if ent.label_ == "PERSON":
+            # Only replace if it's NOT a medical term and NOT preceded by medical prefixes
+            ent_text = ent.text.strip()
+            
+            # Skip if it's already been processed, is a known medical term or
+            # sits in a medical context (dosages, "Tab.", "gel", "Rx", ...)
+            if ("[" not in ent_text and 
+                not medical_spans.overlaps(ent.start_char, ent.end_char) and 
+                not prefix_spans.overlaps(ent.start_char, ent.start_char + 1)):
+                tracked.replace(ent_text, "[PERSON_NAME]", "person")
+                    
+        elif ent.label_ == "DATE":
+            tracked.replace(ent.text, "[DATE]", "date")
+
+    # --- Remove ages and patient IDs ---
+    tracked.apply_rules(POST_NER_RULES)
+
+    return tracked.text, tracked.spans()
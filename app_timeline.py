@@ -1,10 +1,14 @@
 import streamlit as st
-import psycopg2
-from psycopg2.extras import RealDictCursor
 import google.generativeai as genai
-import PyPDF2
-import io
-from datetime import datetime
+import os
+import db
+from chat_history import (ChatHistory, MemoryChatStore, PostgresChatStore, member_conversation_id, new_session_id,
+                          render_chat_history)
+from ingest import ingest_report, prompt_texts, redact_text
+from insights import INLINE_INSIGHT_DELAY, generate_insight, get_stored_insight, store_insight
+from llm_gateway import LLMGateway, GeminiBackend, HttpBackend, LLMTimeoutError, is_rate_limited
+from pipeline import extract_text
+from service_client import ProcessingClient
 
 # Page configuration
 st.set_page_config(
@@ -14,9 +18,16 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Hand uploads to the processing service when configured (see processing_service.py)
+PROCESSING_SERVICE_URL = os.environ.get("PROCESSING_SERVICE_URL")
+
 # Initialize Gemini - Check if API key is valid
 GEMINI_API_KEY = "AIzaSyAZJHtWCI9LBqYVz3FMBfuJqsmo-UMN"
-if GEMINI_API_KEY and len(GEMINI_API_KEY) > 20:  # Basic validation
+# Point at a local fake server instead of Gemini (see fake_llm_server.py)
+LLM_BACKEND_URL = os.environ.get("LLM_BACKEND_URL")
+if LLM_BACKEND_URL:
+    GEMINI_AVAILABLE = True
+elif GEMINI_API_KEY and len(GEMINI_API_KEY) > 20:  # Basic validation
     try:
         genai.configure(api_key=GEMINI_API_KEY)
         GEMINI_AVAILABLE = True
@@ -29,13 +40,7 @@ else:
 @st.cache_resource
 def init_connection():
     try:
-        conn = psycopg2.connect(
-            host="localhost",
-            database="Health_ai",
-            user="postgres",
-            password="jeet",
-            cursor_factory=RealDictCursor
-        )
+        conn = db.connect()
         return conn
     except Exception as e:
         st.error(f"Database connection failed: {e}")
@@ -43,57 +48,36 @@ def init_connection():
 
 conn = init_connection()
 
+# One LLM gateway per process, shared by every session
+@st.cache_resource
+def get_llm_gateway():
+    backend = HttpBackend(LLM_BACKEND_URL) if LLM_BACKEND_URL else GeminiBackend('gemini-1.5-flash')
+    return LLMGateway(backend, rate=2.0, burst=5, max_concurrency=4, timeout=60.0, hedge_after=20.0)
+
 # Initialize database tables
 def init_db():
     if conn is not None:
         try:
-            with conn.cursor() as cur:
-                # Create families table
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS families (
-                        id SERIAL PRIMARY KEY,
-                        phone_number VARCHAR(20) UNIQUE NOT NULL,
-                        head_name VARCHAR(100) NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                # Create family_members table
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS family_members (
-                        id SERIAL PRIMARY KEY,
-                        family_id INTEGER REFERENCES families(id) ON DELETE CASCADE,
-                        name VARCHAR(100) NOT NULL,
-                        age INTEGER NOT NULL,
-                        sex VARCHAR(10) NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                # Create medical_reports table
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS medical_reports (
-                        id SERIAL PRIMARY KEY,
-                        member_id INTEGER REFERENCES family_members(id) ON DELETE CASCADE,
-                        report_text TEXT,
-                        report_date DATE,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                conn.commit()
+            db.init_schema(conn)
         except Exception as e:
             st.error(f"Database initialization failed: {e}")
 
 init_db()
 
+# Chat messages outside the in-memory window live in the database
+CHAT_WINDOW = 30
+
+@st.cache_resource
+def get_chat_store():
+    return PostgresChatStore(conn) if conn is not None else MemoryChatStore()
+
 # Session state initialization
 if "current_family" not in st.session_state:
     st.session_state.current_family = None
 if "current_member" not in st.session_state:
     st.session_state.current_member = None
 if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
+    st.session_state.chat_history = ChatHistory(get_chat_store(), window=CHAT_WINDOW, page_size=CHAT_WINDOW)
 if "registration_step" not in st.session_state:
     st.session_state.registration_step = 0
 if "new_member_data" not in st.session_state:
@@ -106,11 +90,7 @@ if "file_processed" not in st.session_state:
 # Utility functions
 def extract_text_from_pdf(uploaded_file):
     try:
-        pdf_reader = PyPDF2.PdfReader(io.BytesIO(uploaded_file.read()))
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-        return text
+        return extract_text(uploaded_file.getvalue())
     except Exception as e:
         st.error(f"Error reading PDF: {e}")
         return ""
@@ -120,63 +100,46 @@ def get_gemini_insight(report_text, previous_reports=None):
         return "Gemini AI service is currently unavailable. Please check your API key configuration."
     
     try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
-        if previous_reports:
-            # Timeline analysis with previous reports
-            prompt = f"""
-            Analyze this medical report and provide insights in the following structured format:
-            
-            A. CURRENT FINDINGS (from this report):
-            1. Most abnormal finding: [One sentence about the most abnormal finding]
-            2. Most important diagnosis: [One sentence about the primary diagnosis]
-            3. Biggest red flag: [One sentence about the most urgent concern]
-            4. Highest impact treatment: [One sentence about the most impactful medicine or test]
-            5. Signal of change: [One sentence about improvement or deterioration]
-            
-            B. SEQUENTIAL ANALYSIS (compared to previous reports):
-            5. Most important change: [One sentence about the most significant change since last report]
-            6. Standout trend: [One sentence about the most notable trend across reports]
-            7. Health journey pattern: [One sentence describing the overall pattern: improving, stable, or worsening]
-            8. Change driver: [One sentence about the main factor driving health changes]
-            
-            C. PREDICTIVE INSIGHTS (forward-looking):
-            9. Likely outcome: [One sentence about the most likely outcome if trends continue]
-            10. Recovery timeline: [One sentence estimating earliest possible recovery time]
-            13. Complication risk: [One sentence about the highest risk complication]
-            15. Critical action step: [One sentence about the most important step to change trajectory]
-            
-            Previous reports context: {previous_reports}
-            
-            Current report: {report_text}
-            
-            Provide only the 15 insights in the exact format above, without any additional text.
-            """
-        else:
-            # First-time analysis
-            prompt = f"""
-            Analyze this medical report and provide insights in the following structured format:
-            
-            A. CURRENT FINDINGS (from this report):
-            1. Most abnormal finding: [One sentence about the most abnormal finding]
-            2. Most important diagnosis: [One sentence about the primary diagnosis]
-            3. Biggest red flag: [One sentence about the most urgent concern]
-            4. Highest impact treatment: [One sentence about the most impactful medicine or test]
-            5. Signal of change: [One sentence about improvement or deterioration]
-            
-            B. SEQUENTIAL ANALYSIS: Not enough historical data for comparison
-            
-            C. PREDICTIVE INSIGHTS: Limited without historical data
-            
-            Report: {report_text}
-            
-            Provide only the insights in the exact format above, without any additional text.
-            """
-        
-        response = model.generate_content(prompt)
-        return response.text.strip()
+        return generate_insight(get_llm_gateway(), report_text, previous_reports)
+    except Exception as e:
+        return describe_insight_error(e)
+
+def describe_insight_error(e):
+    if isinstance(e, LLMTimeoutError):
+        return "The AI service took too long to respond. Please try again."
+    if is_rate_limited(e):
+        return "The AI service is busy right now. Please try again in a minute."
+    return f"Error generating insight: {str(e)}"
+
+def get_report_insight(report, previous_reports=None):
+    # Serve the stored insight; only call Gemini on a cache miss, with the reports' anonymized text
+    try:
+        stored = get_stored_insight(conn, report['id'])
+    except Exception as e:
+        conn.rollback()
+        st.error(f"Database error: {e}")
+        stored = None
+    if stored:
+        return stored['insight_text']
+    
+    if not GEMINI_AVAILABLE:
+        return "Gemini AI service is currently unavailable. Please check your API key configuration."
+    
+    texts = get_prompt_texts([report] + (previous_reports or []))
+    if texts is None:
+        return "Could not anonymize the report for analysis."
+    
+    try:
+        insight = generate_insight(get_llm_gateway(), texts[0], texts[1:] or None)
+    except Exception as e:
+        return describe_insight_error(e)
+    
+    try:
+        store_insight(conn, report['id'], insight, get_llm_gateway().backend.name)
     except Exception as e:
-        return f"Error generating insight: {str(e)}"
+        conn.rollback()
+        st.error(f"Error saving insight: {e}")
+    return insight
 
 def get_family_by_phone(phone_number):
     try:
@@ -223,37 +186,70 @@ def create_family_member(family_id, name, age, sex):
         st.error(f"Error creating family member: {e}")
         return None
 
-def save_medical_report(member_id, report_text, report_date=None):
-    if report_date is None:
-        report_date = datetime.now().date()
-    
+def anonymize_report_text(report_text):
     try:
-        with conn.cursor() as cur:
-            cur.execute(
-                """INSERT INTO medical_reports (member_id, report_text, report_date) 
-                VALUES (%s, %s, %s) RETURNING *""",
-                (member_id, report_text, report_date)
-            )
-            conn.commit()
-            return cur.fetchone()
+        return redact_text(report_text)
     except Exception as e:
+        st.error(f"Error anonymizing report: {e}")
+        return None
+
+def save_medical_report(member_id, report_text, redaction, report_date=None):
+    try:
+        # The upload generates the insight right away; the batch worker is only the fallback
+        return ingest_report(conn, member_id, report_text, report_date, redaction, insight_delay=INLINE_INSIGHT_DELAY)
+    except Exception as e:
+        conn.rollback()
         st.error(f"Error saving medical report: {e}")
         return None
 
+def get_prompt_texts(reports):
+    # Stored anonymized text; reports saved before anonymization at ingest are redacted once here
+    try:
+        return prompt_texts(conn, reports)
+    except Exception as e:
+        conn.rollback()
+        st.error(f"Error anonymizing reports: {e}")
+        return None
+
 def get_medical_reports(member_id):
     try:
-        with conn.cursor() as cur:
-            cur.execute(
-                """SELECT * FROM medical_reports 
-                WHERE member_id = %s 
-                ORDER BY report_date DESC""",
-                (member_id,)
-            )
-            return cur.fetchall()
+        return db.fetch_medical_reports(conn, member_id)
     except Exception as e:
         st.error(f"Database error: {e}")
         return []
 
+def search_medical_reports(family_id, query, member_id=None):
+    try:
+        return db.search_medical_reports(conn, family_id, query, member_id)
+    except Exception as e:
+        conn.rollback()
+        st.error(f"Search error: {e}")
+        return []
+
+def open_member_chat(member, greeting=None):
+    # Reopen the member's own conversation; replay the latest analysis only when it is new
+    history = st.session_state.chat_history
+    try:
+        history.open(member_conversation_id(st.session_state.current_family['id'], member['id']))
+    except Exception as e:
+        st.error(f"Error loading chat history: {e}")
+    is_new = not history
+    if greeting:
+        history.append({"role": "assistant", "content": greeting})
+    if is_new:
+        show_latest_analysis(member)
+
+def show_latest_analysis(member):
+    # Replay the stored analysis of the member's most recent report
+    reports = get_medical_reports(member['id'])
+    if reports:
+        latest = reports[0]
+        insight = get_report_insight(latest, reports[1:])
+        st.session_state.chat_history.append({
+            "role": "assistant", 
+            "content": f"**Latest Report Analysis ({latest['report_date']}):** {insight}"
+        })
+
 # UI Components
 def render_sidebar():
     with st.sidebar:
@@ -266,7 +262,7 @@ def render_sidebar():
             if st.button("Logout"):
                 st.session_state.current_family = None
                 st.session_state.current_member = None
-                st.session_state.chat_history = []
+                st.session_state.chat_history.open(new_session_id())
                 st.session_state.registration_step = 0
                 st.session_state.file_processed = False
                 st.rerun()
@@ -282,8 +278,8 @@ def render_sidebar():
                     use_container_width=True
                 ):
                     st.session_state.current_member = member
-                    st.session_state.chat_history = []
                     st.session_state.file_processed = False
+                    open_member_chat(member)
                     st.rerun()
             
             if st.button("+ Add New Member"):
@@ -293,6 +289,23 @@ def render_sidebar():
         else:
             st.info("Please enter your phone number to get started")
 
+def render_report_search():
+    with st.expander("🔍 Search reports"):
+        query = st.text_input("Search all reports", placeholder="e.g. HbA1c, thyroid, metformin", key="report_search")
+        member = st.session_state.current_member
+        only_member = member is not None and st.checkbox(f"Only {member['name']}'s reports", key="report_search_member")
+        if query.strip():
+            results = search_medical_reports(
+                st.session_state.current_family['id'],
+                query,
+                member['id'] if only_member else None
+            )
+            if not results:
+                st.info("No reports match your search.")
+            for result in results:
+                st.markdown(f"**{result['member_name']}** · {result['report_date']}")
+                st.markdown(result['snippet'])
+
 def render_chat_interface():
     st.header("Health Analysis Chat")
     
@@ -300,9 +313,7 @@ def render_chat_interface():
     chat_container = st.container(height=400)
     
     with chat_container:
-        for message in st.session_state.chat_history:
-            with st.chat_message(message["role"]):
-                st.markdown(message["content"])
+        render_chat_history(st.session_state.chat_history, key="chat")
     
     # User input
     if prompt := st.chat_input("Type your message here...", key="chat_input"):
@@ -343,10 +354,10 @@ def process_user_message(message):
             for member in members:
                 if member['name'].lower() == message.lower():
                     st.session_state.current_member = member
-                    st.session_state.chat_history.append({
-                        "role": "assistant", 
-                        "content": f"Now analyzing reports for {member['name']}. You can upload a medical report PDF."
-                    })
+                    open_member_chat(
+                        member,
+                        f"Now analyzing reports for {member['name']}. You can upload a medical report PDF."
+                    )
                     break
         elif "add" in message.lower() and "member" in message.lower():
             st.session_state.registration_step = 2
@@ -370,6 +381,35 @@ def process_user_message(message):
             "content": "Please upload a medical report PDF using the file uploader below."
         })
 
+def add_analysis_messages(insight, previous_count):
+    # Add to chat history
+    st.session_state.chat_history.append({
+        "role": "assistant", 
+        "content": f"**Report Analysis:** {insight}"
+    })
+    
+    # Show timeline if previous reports exist
+    if previous_count:
+        st.session_state.chat_history.append({
+            "role": "assistant", 
+            "content": f"**Timeline Insight:** Compared to {previous_count} previous report(s), I've noted changes in your health metrics."
+        })
+
+def process_report_remotely(uploaded_file):
+    # Extraction, storage and insight all run on the processing service
+    try:
+        result = ProcessingClient(PROCESSING_SERVICE_URL).run(
+            "report", uploaded_file.getvalue(), member_id=st.session_state.current_member['id']
+        )
+    except Exception as e:
+        st.error(f"Processing service error: {e}")
+        st.session_state.file_processed = False
+        return
+    
+    insight = result["insight"] or f"Error generating insight: {result['insight_error']}"
+    add_analysis_messages(insight, result["previous_count"])
+    st.rerun()
+
 def render_file_uploader():
     if st.session_state.current_member:
         st.subheader("Upload Medical Report")
@@ -377,37 +417,34 @@ def render_file_uploader():
         # Use a unique key for the file uploader to prevent re-processing
         uploaded_file = st.file_uploader("Choose a PDF file", type="pdf", key=f"report_uploader_{st.session_state.current_member['id']}")
         
-        if uploaded_file is not None and not st.session_state.file_processed:
+        if uploaded_file is not None and not st.session_state.file_processed and PROCESSING_SERVICE_URL:
+            st.session_state.file_processed = True
+            with st.spinner("Analyzing report..."):
+                process_report_remotely(uploaded_file)
+        elif uploaded_file is not None and not st.session_state.file_processed:
             st.session_state.file_processed = True
             with st.spinner("Analyzing report..."):
                 # Extract text from PDF
                 report_text = extract_text_from_pdf(uploaded_file)
                 
-                if report_text:
+                # Anonymize once; the stored copy is what every later prompt uses
+                redaction = anonymize_report_text(report_text) if report_text else None
+                
+                if redaction:
                     # Get previous reports for timeline analysis
                     previous_reports = get_medical_reports(st.session_state.current_member['id'])
-                    previous_texts = [r['report_text'] for r in previous_reports] if previous_reports else None
-                    
-                    # Get insight from Gemini
-                    insight = get_gemini_insight(report_text, previous_texts)
-                    
-                    # Save the report
-                    save_medical_report(st.session_state.current_member['id'], report_text)
                     
-                    # Add to chat history
-                    st.session_state.chat_history.append({
-                        "role": "assistant", 
-                        "content": f"**Report Analysis:** {insight}"
-                    })
-                    
-                    # Show timeline if previous reports exist
-                    if previous_reports:
-                        st.session_state.chat_history.append({
-                            "role": "assistant", 
-                            "content": f"**Timeline Insight:** Compared to {len(previous_reports)} previous report(s), I've noted changes in your health metrics."
-                        })
+                    # Save the report, then get (and store) its insight from Gemini
+                    report = save_medical_report(st.session_state.current_member['id'], report_text, redaction)
+                    if report:
+                        insight = get_report_insight(report, previous_reports)
+                    else:
+                        insight = get_gemini_insight(redaction[0], get_prompt_texts(previous_reports) or None)
                     
+                    add_analysis_messages(insight, len(previous_reports))
                     st.rerun()
+                elif report_text:
+                    st.session_state.file_processed = False
                 else:
                     st.error("Could not extract text from the PDF. Please try another file.")
                     st.session_state.file_processed = False
@@ -518,6 +555,7 @@ def main():
         if st.session_state.registration_step > 0:
             render_registration_form()
         else:
+            render_report_search()
             render_chat_interface()
             render_file_uploader()
     else:
@@ -0,0 +1,136 @@
+"""Measure how much the delta prompts (report_diff.py) save over sending previous reports in full.
+
+For each report of a member's timeline after the first, both timeline prompts
+are built and their token estimate (words * 1.33, as jj.py counts) compared.
+Reports are read from a directory of .txt files in chronological file-name
+order, or generated as a synthetic lab-report series.
+
+With --compare-insights both prompts are also sent to the LLM (LLM_BACKEND_URL
+or GEMINI_API_KEY, see insights.make_default_gateway) and the sequential and
+predictive items of the two answers are compared, to check that the shorter
+prompt keeps the insight quality.
+
+    python bench_delta_prompts.py --reports 8
+    python bench_delta_prompts.py samples/member_12/ --compare-insights
+"""
+import argparse
+import difflib
+import os
+import random
+import sys
+
+from insights import build_insight_prompt, parse_insight
+
+BOILERPLATE = """CITY DIAGNOSTICS - NABL ACCREDITED LABORATORY
+12, Station Road, Pune 411001 | Reg. No. LAB/2291
+Sample type: Venous blood (EDTA, fluoride, plain)
+Collected at: Home collection | Processed at: Central laboratory
+Method: HbA1c by HPLC; glucose by hexokinase; lipids by enzymatic colorimetry
+Note: Results relate only to the sample tested. Correlate clinically.
+This report is electronically verified and does not need a signature.
+"""
+
+TESTS = [
+    ("Haemoglobin", 11.2, "g/dL", "13.0 - 17.0", 0.3),
+    ("HbA1c", 8.1, "%", "4.0 - 5.6", 0.3),
+    ("Fasting blood sugar", 156, "mg/dL", "70 - 100", 8),
+    ("Post prandial blood sugar", 221, "mg/dL", "70 - 140", 12),
+    ("Serum creatinine", 1.1, "mg/dL", "0.7 - 1.3", 0.05),
+    ("Total cholesterol", 212, "mg/dL", "< 200", 6),
+    ("LDL cholesterol", 138, "mg/dL", "< 100", 5),
+    ("HDL cholesterol", 41, "mg/dL", "> 40", 1),
+    ("Triglycerides", 182, "mg/dL", "< 150", 9),
+    ("TSH", 3.2, "uIU/mL", "0.4 - 4.0", 0.2),
+]
+
+
+def synthetic_reports(count, seed=7):
+    """A member's lab reports, oldest first: same lab and layout, values drifting"""
+    rng = random.Random(seed)
+    values = {name: start for name, start, _, _, _ in TESTS}
+    reports = []
+    for i in range(count):
+        lines = [BOILERPLATE, f"Report date: 2024-{i % 12 + 1:02d}-15", "Test Result Units Reference"]
+        for name, _, units, reference, step in TESTS:
+            if rng.random() < 0.6:
+                values[name] = round(values[name] + rng.uniform(-step, step * 0.5), 1)
+            lines.append(f"{name:<28} {values[name]:<8g} {units:<8} {reference}")
+        if i % 3 == 2:
+            lines.append("Advice: Tab. Metformin 500mg twice daily after meals; repeat HbA1c in 3 months")
+        reports.append("\n".join(lines))
+    return reports
+
+
+def load_reports(directory):
+    names = sorted(f for f in os.listdir(directory) if f.lower().endswith(".txt"))
+    reports = []
+    for name in names:
+        with open(os.path.join(directory, name), encoding="utf-8") as f:
+            reports.append(f.read())
+    return reports
+
+
+def estimate_tokens(text):
+    return int(len(text.split()) * 1.33)
+
+
+def timeline_items(insight_text):
+    """Texts of the sequential (B) and predictive (C) items, by item number"""
+    return {
+        item["number"]: item["text"]
+        for section in parse_insight(insight_text)["sections"] if section["key"] in ("B", "C")
+        for item in section["items"]
+    }
+
+
+def compare_insights(full_text, delta_text):
+    """Mean word similarity of the B/C items present in both answers, and how many items each has"""
+    full_items, delta_items = timeline_items(full_text), timeline_items(delta_text)
+    common = set(full_items) & set(delta_items)
+    scores = [
+        difflib.SequenceMatcher(None, full_items[n].lower().split(), delta_items[n].lower().split()).ratio()
+        for n in common
+    ]
+    return (sum(scores) / len(scores) if scores else 0.0), len(full_items), len(delta_items)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", nargs="?", help="one member's reports as .txt files (default: synthetic)")
+    parser.add_argument("--reports", type=int, default=6, help="length of the synthetic series")
+    parser.add_argument("--compare-insights", action="store_true", help="also call the LLM with both prompts")
+    args = parser.parse_args()
+
+    reports = load_reports(args.directory) if args.directory else synthetic_reports(args.reports)
+    if len(reports) < 2:
+        print("Need at least two reports")
+        return 1
+
+    gateway = None
+    if args.compare_insights:
+        from insights import make_default_gateway
+        gateway = make_default_gateway()
+
+    print(f"{'report':>6} {'previous':>8} {'full tokens':>12} {'delta tokens':>13} {'saved':>7}"
+          + (f" {'B/C agreement':>14} {'items full/delta':>17}" if gateway else ""))
+    total_full = total_delta = 0
+    for i in range(1, len(reports)):
+        current, previous = reports[i], list(reversed(reports[:i]))
+        full_prompt = build_insight_prompt(current, previous, delta=False)
+        delta_prompt = build_insight_prompt(current, previous)
+        full_tokens, delta_tokens = estimate_tokens(full_prompt), estimate_tokens(delta_prompt)
+        total_full += full_tokens
+        total_delta += delta_tokens
+        line = f"{i + 1:>6} {len(previous):>8} {full_tokens:>12} {delta_tokens:>13} {1 - delta_tokens / full_tokens:>6.0%}"
+        if gateway:
+            agreement, full_count, delta_count = compare_insights(
+                gateway.generate(full_prompt), gateway.generate(delta_prompt)
+            )
+            line += f" {agreement:>14.2f} {full_count:>8}/{delta_count:<8}"
+        print(line)
+    print(f"\nTotal: {total_full} -> {total_delta} tokens ({1 - total_delta / total_full:.0%} fewer)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
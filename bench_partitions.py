@@ -0,0 +1,155 @@
+"""Compare medical_reports as one heap table and as yearly partitions at 10M+ rows.
+
+Builds three copies of a synthetic report table in a scratch schema of the
+HEALTH_AI_DB_* database (see db.py):
+
+- heap: the original layout, primary key only
+- heap_indexed: the heap plus the (member_id, report_date DESC, id DESC) index
+- partitioned: yearly range partitions with the same index (db.MEDICAL_REPORTS_TABLE)
+
+then times get_medical_reports' query for random members, and VACUUM after a
+round of updates to this year's reports (the only year that sees writes).
+Expect roughly 2-3 GB per copy at the defaults.
+
+    python bench_partitions.py
+    python bench_partitions.py --rows 20000000 --members 500000 --keep
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import date
+
+import db
+
+SCHEMA = "bench_partitions"
+TABLES = ["heap", "heap_indexed", "partitioned"]
+
+
+def timed(cur, sql, params=None):
+    start = time.perf_counter()
+    cur.execute(sql, params)
+    return time.perf_counter() - start
+
+
+def build(cur, rows, members, years, text_bytes):
+    first_year = date.today().year - years + 1
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cur.execute(f"CREATE SCHEMA {SCHEMA}")
+    cur.execute(
+        f"""CREATE TABLE {SCHEMA}.heap (
+            id SERIAL PRIMARY KEY, member_id INTEGER, report_text TEXT,
+            report_date DATE NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )"""
+    )
+    print(f"Filling {rows:,} rows ...", flush=True)
+    seconds = timed(
+        cur,
+        f"""INSERT INTO {SCHEMA}.heap (id, member_id, report_text, report_date)
+        SELECT g, 1 + (g * 7919) %% %s, repeat(md5(g::text), %s),
+               make_date(%s, 1, 1) + ((g * 104729) %% (%s * 365))::int
+        FROM generate_series(1::bigint, %s) g""",
+        (members, max(1, text_bytes // 32), first_year, years, rows)
+    )
+    print(f"  heap: {seconds:.1f}s")
+
+    cur.execute(f"CREATE TABLE {SCHEMA}.heap_indexed (LIKE {SCHEMA}.heap INCLUDING ALL)")
+    seconds = timed(cur, f"INSERT INTO {SCHEMA}.heap_indexed SELECT * FROM {SCHEMA}.heap")
+    seconds += timed(cur, f"CREATE INDEX ON {SCHEMA}.heap_indexed (member_id, report_date DESC, id DESC)")
+    print(f"  heap_indexed: {seconds:.1f}s")
+
+    cur.execute(
+        db.MEDICAL_REPORTS_TABLE
+        .replace("IF NOT EXISTS medical_reports", f"{SCHEMA}.partitioned")
+        .replace("REFERENCES family_members(id) ON DELETE CASCADE", "")
+    )
+    for year in range(first_year, first_year + years + 1):
+        cur.execute(
+            f"""CREATE TABLE {SCHEMA}.partitioned_{year} PARTITION OF {SCHEMA}.partitioned
+            FOR VALUES FROM (%s) TO (%s)""",
+            (date(year, 1, 1), date(year + 1, 1, 1))
+        )
+    seconds = timed(cur, f"INSERT INTO {SCHEMA}.partitioned (id, member_id, report_text, report_date, created_at) SELECT * FROM {SCHEMA}.heap")
+    seconds += timed(cur, f"CREATE INDEX ON {SCHEMA}.partitioned (member_id, report_date DESC, id DESC)")
+    print(f"  partitioned: {seconds:.1f}s")
+    for table in TABLES:
+        cur.execute(f"VACUUM ANALYZE {SCHEMA}.{table}")
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+def bench_queries(cur, members, queries, heap_queries):
+    print(f"\nget_medical_reports query (ms)\n{'table':<14} {'runs':>5} {'p50':>9} {'p95':>9}")
+    rng = random.Random(1)
+    for table in TABLES:
+        runs = heap_queries if table == "heap" else queries
+        timings = [
+            1000 * timed(
+                cur,
+                f"SELECT * FROM {SCHEMA}.{table} WHERE member_id = %s ORDER BY report_date DESC, id DESC",
+                (rng.randint(1, members),)
+            )
+            for _ in range(runs)
+        ]
+        print(f"{table:<14} {runs:>5} {percentile(timings, 50):>9.2f} {percentile(timings, 95):>9.2f}")
+
+
+def bench_vacuum(cur, churn):
+    """Update `churn` of this year's reports in every copy, then time the VACUUM that has to follow"""
+    year = date.today().year
+    print(f"\nVACUUM after updating {churn:.0%} of {year}'s reports (s)")
+    for table in TABLES:
+        cur.execute(
+            f"""UPDATE {SCHEMA}.{table} SET report_text = report_text
+            WHERE report_date >= %s AND random() < %s""",
+            (date(year, 1, 1), churn)
+        )
+    for table, target in [
+        ("heap", "heap"),
+        ("heap_indexed", "heap_indexed"),
+        ("partitioned", f"partitioned_{year}"),
+    ]:
+        print(f"{table:<14} VACUUM {target:<20} {timed(cur, f'VACUUM {SCHEMA}.{target}'):>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--members", type=int, default=200_000)
+    parser.add_argument("--years", type=int, default=15, help="report dates spread over this many years")
+    parser.add_argument("--text-bytes", type=int, default=200, help="approximate report_text size")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--heap-queries", type=int, default=5, help="runs on the unindexed heap (full scans)")
+    parser.add_argument("--churn", type=float, default=0.1, help="fraction of this year's reports updated")
+    parser.add_argument("--keep", action="store_true", help=f"keep the {SCHEMA} schema afterwards")
+    args = parser.parse_args()
+
+    conn = db.connect()
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            build(cur, args.rows, args.members, args.years, args.text_bytes)
+            cur.execute(
+                """SELECT c.relname AS name, pg_size_pretty(pg_total_relation_size(c.oid)) AS size
+                FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = %s AND c.relname = ANY(%s)""",
+                (SCHEMA, TABLES)
+            )
+            sizes = {r['name']: r['size'] for r in cur.fetchall()}
+            cur.execute(f"SELECT pg_size_pretty(pg_total_relation_size('{SCHEMA}.partitioned_{date.today().year}')) AS size")
+            print(f"\nSizes: heap {sizes.get('heap')}, heap_indexed {sizes.get('heap_indexed')}, "
+                  f"current-year partition {cur.fetchone()['size']}")
+            bench_queries(cur, args.members, args.queries, args.heap_queries)
+            bench_vacuum(cur, args.churn)
+            if not args.keep:
+                cur.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""Compare the PDF extraction backends on a corpus of sample reports.
+
+For every PDF in the corpus directory, each installed backend is timed (best of
+--repeat runs) and its text compared with a reference:
+
+- <name>.txt next to <name>.pdf, if present (hand-checked ground truth), else
+- the output of --reference-backend (pdfminer by default).
+
+Fidelity is the similarity of the two word sequences (1.0 = identical).
+
+    python bench_pdf_backends.py samples/
+    python bench_pdf_backends.py samples/ --repeat 5 --reference-backend pypdf
+"""
+import argparse
+import difflib
+import os
+import sys
+import time
+
+from pdf_backends import available_backends, extract_pages, get_backend, text_quality
+
+
+def fidelity(text, reference):
+    return difflib.SequenceMatcher(None, text.split(), reference.split(), autojunk=False).ratio()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", help="directory of sample PDFs")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--reference-backend", default="pdfminer")
+    args = parser.parse_args()
+
+    backends = available_backends()
+    if not backends:
+        print("No PDF extraction library is installed")
+        return 1
+    paths = sorted(os.path.join(args.corpus, f) for f in os.listdir(args.corpus) if f.lower().endswith(".pdf"))
+    if not paths:
+        print(f"No PDFs found in {args.corpus}")
+        return 1
+
+    totals = {b.name: {"pages": 0, "seconds": 0.0, "fidelity": [], "quality": [], "errors": 0} for b in backends}
+    auto_choices = {}
+
+    for path in paths:
+        with open(path, "rb") as f:
+            pdf_bytes = f.read()
+
+        reference_path = os.path.splitext(path)[0] + ".txt"
+        if os.path.exists(reference_path):
+            with open(reference_path, encoding="utf-8") as f:
+                reference = f.read()
+        else:
+            try:
+                reference = "\n".join(get_backend(args.reference_backend).extract_pages(pdf_bytes))
+            except Exception:
+                reference = None
+
+        for backend in backends:
+            stats = totals[backend.name]
+            try:
+                best = float("inf")
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    pages = backend.extract_pages(pdf_bytes)
+                    best = min(best, time.perf_counter() - start)
+            except Exception as e:
+                print(f"{os.path.basename(path)}: {backend.name} failed: {e}")
+                stats["errors"] += 1
+                continue
+            stats["pages"] += len(pages)
+            stats["seconds"] += best
+            stats["quality"].append(text_quality(pages))
+            if reference is not None:
+                stats["fidelity"].append(fidelity("\n".join(pages), reference))
+
+        chosen, _ = extract_pages(pdf_bytes)
+        auto_choices[chosen] = auto_choices.get(chosen, 0) + 1
+
+    print(f"\n{len(paths)} document(s); fidelity vs .txt ground truth or {args.reference_backend}\n")
+    print(f"{'backend':<10} {'pages':>6} {'pages/s':>9} {'fidelity':>9} {'quality':>8} {'errors':>7} {'auto-picked':>12}")
+    for name, stats in totals.items():
+        pages_per_second = stats["pages"] / stats["seconds"] if stats["seconds"] else 0.0
+        mean_fidelity = sum(stats["fidelity"]) / len(stats["fidelity"]) if stats["fidelity"] else float("nan")
+        mean_quality = sum(stats["quality"]) / len(stats["quality"]) if stats["quality"] else float("nan")
+        print(f"{name:<10} {stats['pages']:>6} {pages_per_second:>9.1f} {mean_fidelity:>9.3f} "
+              f"{mean_quality:>8.2f} {stats['errors']:>7} {auto_choices.get(name, 0):>12}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,316 @@
+import contextlib
+import itertools
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from functools import lru_cache
+
+import streamlit as st
+
+# Conversations not tied to a family member start with this and are purged
+# once idle (see purge_idle_sessions); member conversations can be reopened
+SESSION_PREFIX = "session-"
+
+# Larger than any message id, for "the latest messages"
+LATEST = 2 ** 62
+
+
+class MemoryChatStore:
+    """Fallback store when no database is available"""
+
+    def __init__(self):
+        self.messages = {}
+        self.last_active = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def append(self, conversation, role, content):
+        with self.lock:
+            message_id = next(self.ids)
+            self.messages.setdefault(conversation, []).append(
+                {"id": message_id, "role": role, "content": content})
+            self.last_active[conversation] = time.time()
+            return message_id
+
+    def summary(self, conversation):
+        """(message count, word count) of a conversation"""
+        with self.lock:
+            messages = self.messages.get(conversation, [])
+            return len(messages), sum(len(m["content"].split()) for m in messages)
+
+    def fetch_before(self, conversation, before_id, limit):
+        with self.lock:
+            older = [m for m in self.messages.get(conversation, []) if m["id"] < before_id]
+            return older[-limit:]
+
+    def delete(self, conversation):
+        with self.lock:
+            self.messages.pop(conversation, None)
+            self.last_active.pop(conversation, None)
+
+    def purge_idle(self, prefix, max_age):
+        """Delete conversations starting with `prefix` that have been idle for `max_age` seconds"""
+        cutoff = time.time() - max_age
+        with self.lock:
+            for conversation, active in list(self.last_active.items()):
+                if conversation.startswith(prefix) and active < cutoff:
+                    self.messages.pop(conversation, None)
+                    del self.last_active[conversation]
+
+
+class PostgresChatStore:
+    """Chat messages in the chat_messages table (see db.SCHEMA)"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    @contextlib.contextmanager
+    def cursor(self):
+        """A cursor whose work is committed, or rolled back on any error so the shared connection stays usable"""
+        try:
+            with self.conn.cursor() as cur:
+                yield cur
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    def append(self, conversation, role, content):
+        with self.cursor() as cur:
+            cur.execute(
+                """INSERT INTO chat_messages (conversation, role, content)
+                VALUES (%s, %s, %s) RETURNING id""",
+                (conversation, role, content)
+            )
+            return cur.fetchone()['id']
+
+    def fetch_before(self, conversation, before_id, limit):
+        with self.cursor() as cur:
+            cur.execute(
+                """SELECT id, role, content FROM chat_messages
+                WHERE conversation = %s AND id < %s
+                ORDER BY id DESC
+                LIMIT %s""",
+                (conversation, before_id, limit)
+            )
+            return [dict(r) for r in reversed(cur.fetchall())]
+
+    def summary(self, conversation):
+        with self.cursor() as cur:
+            cur.execute(
+                """SELECT count(*) AS messages,
+                          coalesce(sum(array_length(regexp_split_to_array(btrim(content), '\\s+'), 1)), 0) AS words
+                FROM chat_messages WHERE conversation = %s""",
+                (conversation,)
+            )
+            row = cur.fetchone()
+        return row['messages'], row['words']
+
+    def delete(self, conversation):
+        with self.cursor() as cur:
+            cur.execute("DELETE FROM chat_messages WHERE conversation = %s", (conversation,))
+
+    def purge_idle(self, prefix, max_age):
+        with self.cursor() as cur:
+            cur.execute(
+                """DELETE FROM chat_messages WHERE conversation IN (
+                    SELECT conversation FROM chat_messages
+                    WHERE conversation LIKE %s
+                    GROUP BY conversation
+                    HAVING max(created_at) < LOCALTIMESTAMP - make_interval(secs => %s)
+                )""",
+                (prefix + "%", max_age)
+            )
+
+
+class SqliteChatStore:
+    """Chat messages in a local SQLite file, for apps without Postgres"""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS chat_messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    conversation TEXT NOT NULL,
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS chat_messages_conversation_idx ON chat_messages (conversation, id)")
+            self.conn.commit()
+
+    def append(self, conversation, role, content):
+        with self.lock:
+            cur = self.conn.execute(
+                "INSERT INTO chat_messages (conversation, role, content) VALUES (?, ?, ?)",
+                (conversation, role, content)
+            )
+            self.conn.commit()
+            return cur.lastrowid
+
+    def fetch_before(self, conversation, before_id, limit):
+        with self.lock:
+            rows = self.conn.execute(
+                """SELECT id, role, content FROM chat_messages
+                WHERE conversation = ? AND id < ?
+                ORDER BY id DESC
+                LIMIT ?""",
+                (conversation, before_id, limit)
+            ).fetchall()
+        return [{"id": r[0], "role": r[1], "content": r[2]} for r in reversed(rows)]
+
+    def summary(self, conversation):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT content FROM chat_messages WHERE conversation = ?", (conversation,)
+            ).fetchall()
+        return len(rows), sum(len(r[0].split()) for r in rows)
+
+    def delete(self, conversation):
+        with self.lock:
+            self.conn.execute("DELETE FROM chat_messages WHERE conversation = ?", (conversation,))
+            self.conn.commit()
+
+    def purge_idle(self, prefix, max_age):
+        with self.lock:
+            self.conn.execute(
+                """DELETE FROM chat_messages WHERE conversation IN (
+                    SELECT conversation FROM chat_messages
+                    WHERE conversation LIKE ?
+                    GROUP BY conversation
+                    HAVING max(created_at) < datetime('now', ?)
+                )""",
+                (prefix + "%", f"-{int(max_age)} seconds")
+            )
+            self.conn.commit()
+
+
+_purge_lock = threading.Lock()
+
+
+def new_session_id():
+    return f"{SESSION_PREFIX}{uuid.uuid4().hex}"
+
+
+def member_conversation_id(family_id, member_id):
+    """Conversation of one family member, reopened whenever the member is selected again"""
+    return f"family-{family_id}-member-{member_id}"
+
+
+def purge_idle_sessions(store, max_age, every=3600):
+    """Delete session conversations idle for `max_age` seconds; runs at most once per `every` seconds per store"""
+    with _purge_lock:
+        now = time.monotonic()
+        last = getattr(store, "last_purge", None)
+        if last is not None and now - last < every:
+            return
+        store.last_purge = now
+    try:
+        store.purge_idle(SESSION_PREFIX, max_age)
+    except Exception as e:
+        # Housekeeping only; the next session retries after `every` seconds
+        print(f"Purging idle chat sessions failed: {e}")
+
+
+class ChatHistory:
+    """Chat history for one session: the latest `window` messages are kept in
+    memory, everything is written to `store`, and older messages are paged
+    back in on request. Appending a new message drops the loaded pages again.
+
+    A new history writes to a throwaway session conversation, which is purged
+    after `session_ttl` seconds of inactivity; open() switches to a named one.
+    Store errors are shown with st.error and the chat carries on in memory.
+    """
+
+    def __init__(self, store, window=30, page_size=30, session_ttl=24 * 3600):
+        self.store = store
+        self.conversation = new_session_id()
+        self.recent = deque(maxlen=window)
+        self.older = []
+        self.page_size = page_size
+        self.total = 0
+        self.word_count = 0
+        purge_idle_sessions(store, session_ttl)
+
+    def open(self, conversation):
+        """Switch to `conversation`, loading its latest messages from the store"""
+        self.conversation = conversation
+        self.recent.clear()
+        self.older = []
+        try:
+            self.total, self.word_count = self.store.summary(conversation)
+            self.recent.extend(self.store.fetch_before(conversation, LATEST, self.recent.maxlen))
+        except Exception as e:
+            st.error(f"Could not load the chat history: {e}")
+            self.total = self.word_count = 0
+
+    def append(self, message):
+        try:
+            message_id = self.store.append(self.conversation, message["role"], message["content"])
+        except Exception as e:
+            st.error(f"Could not save the chat message: {e}")
+            # Kept for this session only; ordered after the last message shown
+            message_id = (self.recent[-1]["id"] if self.recent else 0) + 0.5
+        self.recent.append({"id": message_id, "role": message["role"], "content": message["content"]})
+        self.older = []
+        self.total += 1
+        self.word_count += len(message["content"].split())
+
+    def clear(self):
+        try:
+            self.store.delete(self.conversation)
+        except Exception as e:
+            st.error(f"Could not delete the chat history: {e}")
+        self.recent.clear()
+        self.older = []
+        self.total = 0
+        self.word_count = 0
+
+    def has_older(self):
+        return self.total > len(self.recent) + len(self.older)
+
+    def load_older(self):
+        """Page the next `page_size` older messages in from the store"""
+        visible = self.older or self.recent
+        if visible:
+            try:
+                older = self.store.fetch_before(self.conversation, visible[0]["id"], self.page_size)
+            except Exception as e:
+                st.error(f"Could not load older messages: {e}")
+                return
+            self.older = older + self.older
+
+    def __iter__(self):
+        return itertools.chain(self.older, self.recent)
+
+    def __len__(self):
+        return self.total
+
+    def __bool__(self):
+        return self.total > 0
+
+
+@lru_cache(maxsize=2048)
+def render_markdown(message_id, content):
+    """Prepare a message for st.markdown; cached per message id.
+
+    Single newlines become hard line breaks so the numbered insights keep
+    their layout, and "$" is escaped so prices are not rendered as LaTeX.
+    """
+    lines = content.replace("\r\n", "\n").replace("$", "\\$").split("\n")
+    return "\n".join(line + "  " if line.strip() else line for line in lines)
+
+
+def render_chat_history(history, key):
+    """Render the in-memory messages, with a button to page in older ones"""
+    if history.has_older() and st.button("⬆️ Load older messages", key=f"{key}_load_older"):
+        history.load_older()
+    for message in history:
+        with st.chat_message(message["role"]):
+            st.markdown(render_markdown(message["id"], message["content"]))
@@ -0,0 +1,346 @@
+import os
+from datetime import date, datetime
+
+import psycopg2
+from psycopg2.extras import Json, RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool
+
+# Connection settings, overridable from the environment for workers and tests
+DB_PARAMS = {
+    "host": os.environ.get("HEALTH_AI_DB_HOST", "localhost"),
+    "port": int(os.environ.get("HEALTH_AI_DB_PORT", "5432")),
+    "database": os.environ.get("HEALTH_AI_DB_NAME", "Health_ai"),
+    "user": os.environ.get("HEALTH_AI_DB_USER", "postgres"),
+    "password": os.environ.get("HEALTH_AI_DB_PASSWORD", "jeet"),
+}
+
+MEDICAL_REPORTS_TABLE = """
+    CREATE TABLE IF NOT EXISTS medical_reports (
+        id SERIAL,
+        member_id INTEGER REFERENCES family_members(id) ON DELETE CASCADE,
+        report_text TEXT,
+        redacted_text TEXT,
+        redaction_spans JSONB,
+        redaction_version VARCHAR(16),
+        job_id BIGINT,
+        report_date DATE NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (id, report_date)
+    ) PARTITION BY RANGE (report_date)
+    """
+
+# Anonymized copy of each report, added to tables created before it existed
+REDACTION_COLUMNS = [
+    "ALTER TABLE medical_reports ADD COLUMN IF NOT EXISTS redacted_text TEXT",
+    "ALTER TABLE medical_reports ADD COLUMN IF NOT EXISTS redaction_spans JSONB",
+    "ALTER TABLE medical_reports ADD COLUMN IF NOT EXISTS redaction_version VARCHAR(16)",
+]
+
+# Processing job that stored each report, so a retried job does not store it twice
+REPORT_JOB_COLUMNS = [
+    "ALTER TABLE medical_reports ADD COLUMN IF NOT EXISTS job_id BIGINT",
+    "CREATE INDEX IF NOT EXISTS medical_reports_job_idx ON medical_reports (job_id) WHERE job_id IS NOT NULL",
+]
+
+SCHEMA = [
+    # Create families table
+    """
+    CREATE TABLE IF NOT EXISTS families (
+        id SERIAL PRIMARY KEY,
+        phone_number VARCHAR(20) UNIQUE NOT NULL,
+        head_name VARCHAR(100) NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # Create family_members table
+    """
+    CREATE TABLE IF NOT EXISTS family_members (
+        id SERIAL PRIMARY KEY,
+        family_id INTEGER REFERENCES families(id) ON DELETE CASCADE,
+        name VARCHAR(100) NOT NULL,
+        age INTEGER NOT NULL,
+        sex VARCHAR(10) NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # Create medical_reports table (one partition per year, see ensure_report_partition)
+    MEDICAL_REPORTS_TABLE,
+    *REDACTION_COLUMNS,
+    *REPORT_JOB_COLUMNS,
+    "CREATE INDEX IF NOT EXISTS medical_reports_member_date_idx ON medical_reports (member_id, report_date DESC, id DESC)",
+    # Create report_insights table (one parsed LLM insight per report; no foreign key
+    # because medical_reports is partitioned and its id alone is not unique-constrained)
+    """
+    CREATE TABLE IF NOT EXISTS report_insights (
+        report_id INTEGER PRIMARY KEY,
+        insight_text TEXT NOT NULL,
+        insight_data JSONB NOT NULL,
+        model VARCHAR(100),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # Create chat_messages table (paged chat history, see chat_history.py)
+    """
+    CREATE TABLE IF NOT EXISTS chat_messages (
+        id BIGSERIAL PRIMARY KEY,
+        conversation VARCHAR(64) NOT NULL,
+        role VARCHAR(20) NOT NULL,
+        content TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS chat_messages_conversation_idx ON chat_messages (conversation, id)",
+    # Create processing_jobs table (work queue for processing_service.py)
+    """
+    CREATE TABLE IF NOT EXISTS processing_jobs (
+        id BIGSERIAL PRIMARY KEY,
+        kind VARCHAR(20) NOT NULL,
+        status VARCHAR(10) NOT NULL DEFAULT 'queued',
+        payload JSONB NOT NULL DEFAULT '{}',
+        pdf BYTEA,
+        result JSONB,
+        error TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        started_at TIMESTAMP,
+        finished_at TIMESTAMP,
+        heartbeat_at TIMESTAMP,
+        claim_token VARCHAR(32)
+    )
+    """,
+    # Liveness of the worker running a job (see job_queue.heartbeat), for tables created before it
+    "ALTER TABLE processing_jobs ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMP",
+    "ALTER TABLE processing_jobs ADD COLUMN IF NOT EXISTS claim_token VARCHAR(32)",
+    "CREATE INDEX IF NOT EXISTS processing_jobs_queued_idx ON processing_jobs (id) WHERE status = 'queued'",
+]
+
+
+# Full-text search config used for medical_reports.search_vector
+SEARCH_CONFIG = "english"
+
+
+def connect():
+    """Open a new connection that returns rows as dicts"""
+    return psycopg2.connect(cursor_factory=RealDictCursor, **DB_PARAMS)
+
+
+def connect_pool(minconn, maxconn):
+    """A thread-safe pool of connections like connect()'s, for multi-threaded servers"""
+    return ThreadedConnectionPool(minconn, maxconn, cursor_factory=RealDictCursor, **DB_PARAMS)
+
+
+def init_schema(conn):
+    """Create any missing tables"""
+    with conn.cursor() as cur:
+        for statement in SCHEMA:
+            cur.execute(statement)
+        add_search_vector(cur)
+        add_member_search_index(cur)
+        add_insight_queue(cur)
+    conn.commit()
+
+
+def add_insight_queue(cur):
+    """Create the queue of reports still waiting for an insight, seeding it once from existing reports"""
+    cur.execute("SELECT to_regclass('insight_queue') IS NOT NULL AS exists")
+    if cur.fetchone()['exists']:
+        return
+    cur.execute(
+        """CREATE TABLE insight_queue (
+            report_id INTEGER PRIMARY KEY,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )"""
+    )
+    cur.execute("CREATE INDEX insight_queue_next_attempt_idx ON insight_queue (next_attempt_at)")
+    cur.execute(
+        """INSERT INTO insight_queue (report_id)
+        SELECT r.id FROM medical_reports r
+        LEFT JOIN report_insights i ON i.report_id = r.id
+        WHERE i.report_id IS NULL AND r.report_text IS NOT NULL"""
+    )
+
+
+def add_search_vector(cur):
+    """Add the full-text search column and its GIN index, backfilling existing reports once"""
+    cur.execute(
+        """SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'medical_reports' AND column_name = 'search_vector'"""
+    )
+    if cur.fetchone() is None:
+        cur.execute("ALTER TABLE medical_reports ADD COLUMN search_vector tsvector")
+        cur.execute(
+            "UPDATE medical_reports SET search_vector = to_tsvector(%s, coalesce(report_text, ''))",
+            (SEARCH_CONFIG,)
+        )
+    cur.execute("CREATE INDEX IF NOT EXISTS medical_reports_search_idx ON medical_reports USING GIN (search_vector)")
+
+
+# Schema that partition_reports.py archives cold years into
+ARCHIVE_SCHEMA = "archive"
+
+# Serializes partition creation with archive/restore (see partition_reports.py)
+PARTITION_LOCK = "SELECT pg_advisory_xact_lock(hashtext('medical_reports_partitions'))"
+
+
+def add_member_search_index(cur):
+    """GIN index on (member_id, search_vector), so searches filter by member inside the index.
+
+    Needs the btree_gin extension; without the privilege to create it, searches
+    fall back to the search_vector index alone.
+    """
+    cur.execute("SAVEPOINT member_search_index")
+    try:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+        cur.execute(
+            """CREATE INDEX IF NOT EXISTS medical_reports_member_search_idx
+            ON medical_reports USING GIN (member_id, search_vector)"""
+        )
+    except psycopg2.Error as e:
+        cur.execute("ROLLBACK TO SAVEPOINT member_search_index")
+        print(f"Skipping the member search index: {e}")
+    cur.execute("RELEASE SAVEPOINT member_search_index")
+
+
+def report_partition_name(year):
+    return f"medical_reports_{year}"
+
+
+def ensure_report_partition(cur, report_date):
+    """Create the partition for `report_date`'s year if it does not exist yet.
+
+    A no-op on databases whose medical_reports has not been migrated to a
+    partitioned table (see partition_reports.py). Runs in the caller's
+    transaction; the advisory lock keeps concurrent uploads from racing.
+    Raises ValueError for a year that has been archived: a new partition would
+    hide it and block its restore.
+    """
+    name = report_partition_name(report_date.year)
+    cur.execute(
+        """SELECT c.relkind = 'p' AS partitioned, to_regclass(%s) IS NOT NULL AS exists
+        FROM pg_class c WHERE c.oid = 'medical_reports'::regclass""",
+        (name,)
+    )
+    state = cur.fetchone()
+    if not state['partitioned'] or state['exists']:
+        return
+    cur.execute(PARTITION_LOCK)
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL AS archived", (f"{ARCHIVE_SCHEMA}.{name}",))
+    if cur.fetchone()['archived']:
+        raise ValueError(
+            f"Reports from {report_date.year} are archived; "
+            f"run `python partition_reports.py restore {report_date.year}` before adding one"
+        )
+    cur.execute(
+        f"""CREATE TABLE IF NOT EXISTS {name} PARTITION OF medical_reports
+        FOR VALUES FROM (%s) TO (%s)""",
+        (date(report_date.year, 1, 1), date(report_date.year + 1, 1, 1))
+    )
+
+
+def insert_medical_report(conn, member_id, report_text, report_date=None, redacted_text=None, redaction_spans=None,
+                          redaction_version=None, job_id=None, insight_delay=0):
+    """Store a report and queue it for the insights batch worker, due after `insight_delay` seconds"""
+    if report_date is None:
+        report_date = datetime.now().date()
+    elif isinstance(report_date, str):
+        report_date = date.fromisoformat(report_date)
+    with conn.cursor() as cur:
+        ensure_report_partition(cur, report_date)
+        cur.execute(
+            """INSERT INTO medical_reports (member_id, report_text, redacted_text, redaction_spans, redaction_version,
+                                         job_id, report_date, search_vector)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, to_tsvector(%s, coalesce(%s, ''))) RETURNING *""",
+            (member_id, report_text, redacted_text, Json(redaction_spans) if redaction_spans is not None else None,
+             redaction_version, job_id, report_date, SEARCH_CONFIG, report_text)
+        )
+        report = cur.fetchone()
+        # Picked up by the insights worker unless an insight is stored first
+        cur.execute(
+            """INSERT INTO insight_queue (report_id, next_attempt_at)
+            VALUES (%s, now() + make_interval(secs => %s)) ON CONFLICT DO NOTHING""",
+            (report['id'], insight_delay)
+        )
+    conn.commit()
+    return report
+
+
+def store_redaction(conn, report_id, redacted_text, redaction_spans, redaction_version):
+    """Save the anonymized copy of a report stored without one, or with one from other redaction rules"""
+    with conn.cursor() as cur:
+        cur.execute(
+            """UPDATE medical_reports SET redacted_text = %s, redaction_spans = %s, redaction_version = %s
+            WHERE id = %s AND redaction_version IS DISTINCT FROM %s""",
+            (redacted_text, Json(redaction_spans), redaction_version, report_id, redaction_version)
+        )
+    conn.commit()
+
+
+def fetch_report_for_job(conn, job_id):
+    """The report a processing job already stored, or None"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT * FROM medical_reports WHERE job_id = %s", (job_id,))
+        return cur.fetchone()
+
+
+def fetch_medical_reports(conn, member_id):
+    """A member's reports, newest first"""
+    with conn.cursor() as cur:
+        cur.execute(
+            """SELECT * FROM medical_reports
+            WHERE member_id = %s
+            ORDER BY report_date DESC, id DESC""",
+            (member_id,)
+        )
+        return cur.fetchall()
+
+
+def search_medical_reports(conn, family_id, query, member_id=None, limit=10):
+    """Ranked reports of a family matching `query`, with highlighted snippets.
+
+    Reports with all of the query's words come first. Only if there are none do
+    any of its words count (more matches rank higher), so a question like "when
+    was my HbA1c last measured?" still finds the HbA1c reports. Snippets are
+    only built for the top `limit` rows.
+    """
+    params = {"config": SEARCH_CONFIG, "query": query, "family_id": family_id, "member_id": member_id, "limit": limit}
+    results = _search_reports(conn, params, any_word=False)
+    return results or _search_reports(conn, params, any_word=True)
+
+
+def _search_reports(conn, params, any_word):
+    with conn.cursor() as cur:
+        # The family's member ids are resolved first so the (member_id, search_vector)
+        # index can apply them inside the index scan, before any common word's
+        # matches across all families are collected
+        cur.execute(
+            """WITH q AS (
+                SELECT CASE WHEN %(any_word)s
+                    THEN replace(plainto_tsquery(%(config)s::regconfig, %(query)s)::text, '&', '|')::tsquery
+                    ELSE plainto_tsquery(%(config)s::regconfig, %(query)s)
+                END AS query
+            ),
+            ranked AS (
+                SELECT r.id, r.member_id, m.name AS member_name, r.report_date, r.report_text,
+                       ts_rank(r.search_vector, q.query) AS rank
+                FROM medical_reports r
+                JOIN family_members m ON m.id = r.member_id
+                CROSS JOIN q
+                WHERE r.member_id = ANY(ARRAY(
+                    SELECT id FROM family_members
+                    WHERE family_id = %(family_id)s AND (%(member_id)s::integer IS NULL OR id = %(member_id)s)
+                ))
+                AND r.search_vector @@ q.query
+                ORDER BY rank DESC, r.report_date DESC
+                LIMIT %(limit)s
+            )
+            SELECT ranked.id, ranked.member_id, ranked.member_name, ranked.report_date, ranked.rank,
+                   ts_headline(%(config)s::regconfig, ranked.report_text, q.query,
+                               'MaxFragments=2, MinWords=5, MaxWords=20, StartSel=**, StopSel=**') AS snippet
+            FROM ranked CROSS JOIN q
+            ORDER BY ranked.rank DESC, ranked.report_date DESC""",
+            dict(params, any_word=any_word)
+        )
+        return cur.fetchall()
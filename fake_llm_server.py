@@ -0,0 +1,96 @@
+"""Local stand-in for the Gemini API.
+
+Serves POST {"prompt": ...} -> {"text": ...} with configurable latency and
+failure rates so the LLM gateway and the apps can be exercised offline:
+
+    python fake_llm_server.py --port 8765 --latency 0.8 --rate-limit-rate 0.1
+    LLM_BACKEND_URL=http://localhost:8765 streamlit run app_timeline.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_INSIGHT = """A. CURRENT FINDINGS (from this report):
+1. Most abnormal finding: Fake finding for load and integration testing.
+2. Most important diagnosis: Fake diagnosis.
+3. Biggest red flag: None.
+4. Highest impact treatment: None.
+5. Signal of change: Stable."""
+
+
+def make_handler(latency, jitter, error_rate, rate_limit_rate, script=None):
+    """Request handler class; `script` is an optional list of (seconds, status) for the first requests"""
+    counter = {"requests": 0}
+    lock = threading.Lock()
+    script = list(script or [])
+
+    class FakeLLMHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            prompt = json.loads(self.rfile.read(length) or b"{}").get("prompt", "")
+            with lock:
+                counter["requests"] += 1
+                scripted = script.pop(0) if script else None
+
+            if scripted:
+                delay, status = scripted
+                time.sleep(delay)
+            else:
+                time.sleep(max(0.0, random.gauss(latency, jitter)))
+                status = None
+
+            roll = random.random()
+            if status == 429 or (status is None and roll < rate_limit_rate):
+                self._reply(429, {"error": "Resource has been exhausted (e.g. check quota)."})
+            elif status == 503 or (status is None and roll < rate_limit_rate + error_rate):
+                self._reply(503, {"error": "The service is currently unavailable."})
+            elif "Analyze this medical report" in prompt:
+                self._reply(200, {"text": CANNED_INSIGHT})
+            else:
+                self._reply(200, {"text": f"Fake answer ({len(prompt.split())} prompt words)."})
+
+        def do_GET(self):
+            self._reply(200, {"requests": counter["requests"]})
+
+        def _reply(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                # The client gave up (deadline or a hedged duplicate won)
+                pass
+
+        def log_message(self, format, *args):
+            pass
+
+    return FakeLLMHandler
+
+
+def start_server(port=8765, latency=0.5, jitter=0.1, error_rate=0.0, rate_limit_rate=0.0, script=None):
+    """Start the fake server on a background thread and return it (port 0 picks a free port)"""
+    server = ThreadingHTTPServer(("127.0.0.1", port),
+                                 make_handler(latency, jitter, error_rate, rate_limit_rate, script))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="mean response time in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1, help="std-dev of the response time")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of 503 responses")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of 429 responses")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port),
+                                 make_handler(args.latency, args.jitter, args.error_rate, args.rate_limit_rate))
+    print(f"Fake LLM listening on http://127.0.0.1:{args.port}")
+    server.serve_forever()
@@ -0,0 +1,119 @@
+"""Anonymize each report once, when it is stored, and serve that copy to every later prompt.
+
+Reports keep the original text (for the family's own view and search) next to
+the redacted text and a span map of what was replaced (see
+anonymizer.TrackedText.spans). Every stored redaction carries the
+redaction_version it was made with; rows stored before this existed, or under
+other rules, lexicon or spaCy model, are redacted again the first time a prompt
+needs them, and the result is saved.
+"""
+import hashlib
+import importlib.metadata
+import json
+import sqlite3
+import threading
+from functools import lru_cache
+
+import db
+
+
+def redact_text(text):
+    """(redacted text, span map) from the full clean_sensitive_info pipeline"""
+    from anonymizer import redact
+
+    return redact(text)
+
+
+@lru_cache(maxsize=1)
+def redaction_version():
+    """Short hash of everything that decides a redaction: the regex rules, the medical lexicon and the spaCy model"""
+    from medical_lexicon import lexicon_path
+    from redaction_rules import NLP_MODEL, POST_NER_RULES, PRE_NER_RULES, REDACTION_LOGIC_VERSION, all_patterns
+
+    try:
+        model_version = importlib.metadata.version(NLP_MODEL)
+    except importlib.metadata.PackageNotFoundError:
+        model_version = ""
+    digest = hashlib.sha256(f"{REDACTION_LOGIC_VERSION}\n{NLP_MODEL} {model_version}\n".encode("utf-8"))
+    for name, pattern in all_patterns():
+        digest.update(f"{name}\t{pattern.pattern}\t{pattern.flags}\n".encode("utf-8"))
+    for name, _, replacement in PRE_NER_RULES + POST_NER_RULES:
+        digest.update(f"{name}\t{replacement}\n".encode("utf-8"))
+    with open(lexicon_path(), "rb") as f:
+        digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def ingest_report(conn, member_id, report_text, report_date=None, redaction=None, job_id=None, insight_delay=0):
+    """Store a report with its anonymized copy; pass `redaction` if it was already computed.
+
+    Callers that generate the insight themselves right away pass an
+    `insight_delay` so the batch worker does not generate it a second time.
+    """
+    redacted_text, spans = redaction or redact_text(report_text)
+    return db.insert_medical_report(
+        conn, member_id, report_text, report_date, redacted_text, spans,
+        redaction_version=redaction_version(), job_id=job_id, insight_delay=insight_delay
+    )
+
+
+def prompt_texts(conn, reports):
+    """Anonymized text of each report row, redoing and saving any missing or out-of-date redaction"""
+    version = redaction_version()
+    texts = []
+    for report in reports:
+        if report.get('redacted_text') is None or report.get('redaction_version') != version:
+            redacted_text, spans = redact_text(report['report_text'] or "")
+            db.store_redaction(conn, report['id'], redacted_text, spans, version)
+            report['redacted_text'] = redacted_text
+            report['redaction_version'] = version
+        texts.append(report['redacted_text'])
+    return texts
+
+
+def pdf_digest(pdf_bytes):
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+class SqliteRedactionCache:
+    """Anonymized PDFs by content hash and redaction_version in a local SQLite file, for jj.py's "Process PDF" """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS redacted_pdfs (
+                    digest TEXT PRIMARY KEY,
+                    redacted_text TEXT NOT NULL,
+                    redaction_spans TEXT NOT NULL,
+                    redaction_version TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(redacted_pdfs)")]
+            if "redaction_version" not in columns:
+                # Files cached before versioning never match and are redacted again
+                self.conn.execute("ALTER TABLE redacted_pdfs ADD COLUMN redaction_version TEXT")
+            self.conn.commit()
+
+    def get(self, digest):
+        """The cached redaction of a PDF, or None if there is none from the current redaction_version"""
+        with self.lock:
+            row = self.conn.execute(
+                """SELECT redacted_text, redaction_spans FROM redacted_pdfs
+                WHERE digest = ? AND redaction_version = ?""",
+                (digest, redaction_version())
+            ).fetchone()
+        if row is None:
+            return None
+        return {"redacted_text": row[0], "spans": json.loads(row[1])}
+
+    def put(self, digest, redacted_text, spans, version):
+        with self.lock:
+            self.conn.execute(
+                """INSERT OR REPLACE INTO redacted_pdfs (digest, redacted_text, redaction_spans, redaction_version)
+                VALUES (?, ?, ?, ?)""",
+                (digest, redacted_text, json.dumps(spans), version)
+            )
+            self.conn.commit()
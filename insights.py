@@ -0,0 +1,320 @@
+"""Build, parse and persist the 15-point report insight.
+
+Run as a script to precompute insights for reports that do not have one yet:
+
+    python insights.py --workers 4            # keep polling for new reports
+    python insights.py --once                 # drain the backlog and exit
+"""
+import argparse
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+from psycopg2.extras import Json
+
+from ingest import prompt_texts
+from llm_gateway import is_retryable
+from report_diff import report_delta, value_trends
+
+# A report whose insight failed this many times is parked in insight_queue
+MAX_INSIGHT_ATTEMPTS = 5
+
+# A claimed report is hidden from other batch workers for this long; if its
+# worker dies, the report comes back after the lease
+INSIGHT_LEASE_SECONDS = 900
+
+# Uploads that generate their insight inline queue it for the batch worker
+# only after this long, as a fallback if the inline call fails
+INLINE_INSIGHT_DELAY = 600
+
+INSIGHT_SECTION_RE = re.compile(r"^\s*([ABC])\.\s*([A-Z][A-Z ]{2,40}?)\s*(?:\(([^)]{0,60})\))?\s*:\s*(.{0,300}?)\s*$")
+INSIGHT_ITEM_RE = re.compile(r"^\s*(\d{1,2})\.\s*([^:\n]{1,60}):\s*(.{0,1000}?)\s*$")
+
+
+def build_previous_context(report_text, previous_reports):
+    """Timeline context: what changed since the previous report, and how values moved before that.
+
+    Falls back to the previous report in full when it is too different to diff.
+    """
+    delta = report_delta(previous_reports[0], report_text)
+    if delta is None:
+        context = f"Previous report: {previous_reports[0]}"
+    elif delta:
+        context = f"Changes since the previous report (unchanged lines omitted):\n{delta}"
+    else:
+        context = "The previous report had identical contents."
+    if len(previous_reports) > 1:
+        trends = value_trends(report_text, previous_reports)
+        if trends:
+            context += f"\n\nValues across all reports (oldest first, ending with the current report):\n{trends}"
+    return context
+
+
+def build_insight_prompt(report_text, previous_reports=None, delta=True):
+    """Prompt asking for the structured insight, with timeline context if available.
+
+    With `delta` the previous reports are reduced to their differences from this
+    one (see report_diff.py); otherwise they are sent in full.
+    """
+    if previous_reports:
+        previous_context = (
+            build_previous_context(report_text, previous_reports) if delta
+            else f"Previous reports context: {previous_reports}"
+        )
+        # Timeline analysis with previous reports
+        return f"""
+            Analyze this medical report and provide insights in the following structured format:
+
+            A. CURRENT FINDINGS (from this report):
+            1. Most abnormal finding: [One sentence about the most abnormal finding]
+            2. Most important diagnosis: [One sentence about the primary diagnosis]
+            3. Biggest red flag: [One sentence about the most urgent concern]
+            4. Highest impact treatment: [One sentence about the most impactful medicine or test]
+            5. Signal of change: [One sentence about improvement or deterioration]
+
+            B. SEQUENTIAL ANALYSIS (compared to previous reports):
+            5. Most important change: [One sentence about the most significant change since last report]
+            6. Standout trend: [One sentence about the most notable trend across reports]
+            7. Health journey pattern: [One sentence describing the overall pattern: improving, stable, or worsening]
+            8. Change driver: [One sentence about the main factor driving health changes]
+
+            C. PREDICTIVE INSIGHTS (forward-looking):
+            9. Likely outcome: [One sentence about the most likely outcome if trends continue]
+            10. Recovery timeline: [One sentence estimating earliest possible recovery time]
+            13. Complication risk: [One sentence about the highest risk complication]
+            15. Critical action step: [One sentence about the most important step to change trajectory]
+
+            {previous_context}
+
+            Current report: {report_text}
+
+            Provide only the 15 insights in the exact format above, without any additional text.
+            """
+    # First-time analysis
+    return f"""
+            Analyze this medical report and provide insights in the following structured format:
+
+            A. CURRENT FINDINGS (from this report):
+            1. Most abnormal finding: [One sentence about the most abnormal finding]
+            2. Most important diagnosis: [One sentence about the primary diagnosis]
+            3. Biggest red flag: [One sentence about the most urgent concern]
+            4. Highest impact treatment: [One sentence about the most impactful medicine or test]
+            5. Signal of change: [One sentence about improvement or deterioration]
+
+            B. SEQUENTIAL ANALYSIS: Not enough historical data for comparison
+
+            C. PREDICTIVE INSIGHTS: Limited without historical data
+
+            Report: {report_text}
+
+            Provide only the insights in the exact format above, without any additional text.
+            """
+
+
+def generate_insight(gateway, report_text, previous_reports=None):
+    """Ask the LLM for an insight; errors are raised, not returned as text"""
+    return gateway.generate(build_insight_prompt(report_text, previous_reports)).strip()
+
+
+def parse_insight(insight_text):
+    """Split the model's answer into sections and numbered items.
+
+    Returns {"sections": [{"key", "title", "note", "items": [{"number", "label", "text"}]}]}.
+    Lines that do not follow the format are kept in the current section's "note".
+    """
+    sections = []
+    current = None
+    for line in insight_text.splitlines():
+        line = line.strip().replace("**", "")
+        if not line:
+            continue
+        section = INSIGHT_SECTION_RE.match(line)
+        if section:
+            current = {
+                "key": section.group(1),
+                "title": section.group(2).strip(),
+                "note": section.group(4) or "",
+                "items": [],
+            }
+            sections.append(current)
+            continue
+        if current is None:
+            current = {"key": "", "title": "", "note": "", "items": []}
+            sections.append(current)
+        item = INSIGHT_ITEM_RE.match(line)
+        if item:
+            current["items"].append({
+                "number": int(item.group(1)),
+                "label": item.group(2).strip(),
+                "text": item.group(3),
+            })
+        else:
+            current["note"] = f"{current['note']} {line}".strip()
+    return {"sections": sections}
+
+
+def get_stored_insight(conn, report_id):
+    with conn.cursor() as cur:
+        cur.execute("SELECT * FROM report_insights WHERE report_id = %s", (report_id,))
+        return cur.fetchone()
+
+
+def store_insight(conn, report_id, insight_text, model=None):
+    """Persist an insight; the first one stored for a report wins"""
+    with conn.cursor() as cur:
+        cur.execute(
+            """INSERT INTO report_insights (report_id, insight_text, insight_data, model)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (report_id) DO NOTHING""",
+            (report_id, insight_text, Json(parse_insight(insight_text)), model)
+        )
+        cur.execute("DELETE FROM insight_queue WHERE report_id = %s", (report_id,))
+    conn.commit()
+
+
+def record_insight_failure(conn, report_id, error, retryable=True):
+    """Back the report off exponentially (1 minute, doubling, at most a day); park it if not retryable"""
+    with conn.cursor() as cur:
+        cur.execute(
+            """UPDATE insight_queue
+            SET attempts = CASE WHEN %(retryable)s THEN attempts + 1 ELSE %(max)s END,
+                last_error = %(error)s,
+                next_attempt_at = now() + least(interval '1 minute' * power(2, attempts), interval '1 day')
+            WHERE report_id = %(report_id)s""",
+            {"retryable": retryable, "max": MAX_INSIGHT_ATTEMPTS, "error": str(error)[:2000], "report_id": report_id}
+        )
+    conn.commit()
+
+
+def get_previous_report_texts(conn, report):
+    """Anonymized texts of the member's reports that came before `report`, newest first"""
+    with conn.cursor() as cur:
+        cur.execute(
+            """SELECT id, report_text, redacted_text FROM medical_reports
+            WHERE member_id = %s AND (report_date, id) < (%s, %s)
+            ORDER BY report_date DESC, id DESC""",
+            (report['member_id'], report['report_date'], report['id'])
+        )
+        previous = cur.fetchall()
+    return prompt_texts(conn, previous) or None
+
+
+def claim_pending_reports(conn, limit, lease=INSIGHT_LEASE_SECONDS):
+    """Claim up to `limit` queued reports that are due for an insight attempt, least recently tried first.
+
+    Claimed reports are leased (next_attempt_at pushed `lease` seconds out), so
+    concurrent batch workers never pick up the same report.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            """WITH due AS (
+                SELECT q.report_id FROM insight_queue q
+                JOIN medical_reports r ON r.id = q.report_id
+                WHERE q.next_attempt_at <= now() AND q.attempts < %s AND r.report_text IS NOT NULL
+                ORDER BY q.next_attempt_at, q.report_id
+                LIMIT %s
+                FOR UPDATE OF q SKIP LOCKED
+            )
+            UPDATE insight_queue q SET next_attempt_at = now() + make_interval(secs => %s)
+            FROM due WHERE q.report_id = due.report_id
+            RETURNING q.report_id""",
+            (MAX_INSIGHT_ATTEMPTS, limit, lease)
+        )
+        report_ids = [row['report_id'] for row in cur.fetchall()]
+    conn.commit()
+    if not report_ids:
+        return []
+    with conn.cursor() as cur:
+        cur.execute("SELECT * FROM medical_reports WHERE id = ANY(%s) ORDER BY id", (report_ids,))
+        return cur.fetchall()
+
+
+def precompute_insights(connect, gateway, workers=4, batch_size=50):
+    """Claim one batch of pending reports and generate and store their insights.
+
+    Any number of these workers can run at once; each claims its own reports.
+    Each pool thread keeps its own connection. Returns the number of insights
+    stored; failures are recorded in insight_queue and retried with backoff.
+    """
+    local = threading.local()
+    opened = []
+
+    def thread_conn():
+        if getattr(local, "conn", None) is None:
+            local.conn = connect()
+            opened.append(local.conn)
+        return local.conn
+
+    def process(report):
+        conn = thread_conn()
+        try:
+            previous = get_previous_report_texts(conn, report)
+            insight = generate_insight(gateway, prompt_texts(conn, [report])[0], previous)
+            store_insight(conn, report['id'], insight, gateway.backend.name)
+            return True
+        except Exception as e:
+            conn.rollback()
+            print(f"Insight for report {report['id']} failed: {e}")
+            try:
+                # Database hiccups are always worth another try; so are rate limits and 5xx
+                record_insight_failure(conn, report['id'], e, is_retryable(e) or isinstance(e, psycopg2.Error))
+            except Exception:
+                conn.rollback()
+            return False
+
+    conn = connect()
+    try:
+        pending = claim_pending_reports(conn, batch_size)
+    finally:
+        conn.close()
+    if not pending:
+        return 0
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            stored = sum(pool.map(process, pending))
+    finally:
+        for worker_conn in opened:
+            worker_conn.close()
+    return stored
+
+
+def make_default_gateway():
+    """Gateway for the batch worker: local fake server or Gemini, as in the apps"""
+    from llm_gateway import GeminiBackend, HttpBackend, LLMGateway
+
+    if os.environ.get("LLM_BACKEND_URL"):
+        backend = HttpBackend(os.environ["LLM_BACKEND_URL"])
+    else:
+        import google.generativeai as genai
+        genai.configure(api_key=os.environ["GEMINI_API_KEY"])
+        backend = GeminiBackend('gemini-1.5-flash')
+    return LLMGateway(backend, rate=2.0, burst=5, max_concurrency=4, timeout=120.0)
+
+
+if __name__ == "__main__":
+    import db
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--poll-interval", type=float, default=10.0, help="seconds between polls when idle")
+    parser.add_argument("--once", action="store_true", help="exit when no pending reports remain")
+    args = parser.parse_args()
+
+    conn = db.connect()
+    db.init_schema(conn)
+    conn.close()
+
+    gateway = make_default_gateway()
+    while True:
+        stored = precompute_insights(db.connect, gateway, args.workers, args.batch_size)
+        if stored:
+            print(f"Stored {stored} insight(s)")
+            continue
+        if args.once:
+            break
+        time.sleep(args.poll_interval)
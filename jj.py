@@ -1,27 +1,41 @@
-import re
-import spacy
-import PyPDF2
+import os
 import streamlit as st
 import google.generativeai as genai
 from typing import Union
 from io import BytesIO
+from anonymizer import get_nlp, redact
+from chat_history import ChatHistory, SqliteChatStore, render_chat_history
+from ingest import SqliteRedactionCache, pdf_digest, redaction_version
+from pipeline import extract_pages
+from service_client import ProcessingClient
+from llm_gateway import LLMGateway, GeminiBackend, HttpBackend, LLMTimeoutError, is_rate_limited
 
-# Load spaCy NER
-try:
-    nlp = spacy.load("en_core_web_sm")
-except OSError:
-    st.error("Please install the spaCy English model: 'python -m spacy download en_core_web_sm'")
-    st.stop()
+# Point at a local fake server instead of Gemini (see fake_llm_server.py)
+LLM_BACKEND_URL = os.environ.get("LLM_BACKEND_URL")
+
+# Chat messages outside the in-memory window, and anonymized PDFs by content
+# hash, are kept in a local SQLite file
+CHAT_DB_PATH = os.environ.get("CHAT_DB_PATH", "chat_history.sqlite3")
+CHAT_WINDOW = 30
+
+# Hand extraction and anonymization to the processing service when configured
+PROCESSING_SERVICE_URL = os.environ.get("PROCESSING_SERVICE_URL")
+
+# Load spaCy NER (only needed when processing locally)
+if not PROCESSING_SERVICE_URL:
+    try:
+        get_nlp()
+    except OSError:
+        st.error("Please install the spaCy English model: 'python -m spacy download en_core_web_sm'")
+        st.stop()
 
 def extract_text_from_pdf(pdf_file) -> Union[str, None]:
     try:
         text = ""
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
         
         # Extract text from each page
-        for page_num in range(len(pdf_reader.pages)):
-            page = pdf_reader.pages[page_num]
-            text += page.extract_text() + "\n\n"
+        for page_text in extract_pages(pdf_file.getvalue()):
+            text += page_text + "\n\n"
     
         return text.strip()
     
@@ -29,107 +43,13 @@ def extract_text_from_pdf(pdf_file) -> Union[str, None]:
         st.error(f"Error reading PDF: {e}")
         return None
 
-def clean_sensitive_info(text):
-    # Define comprehensive list of medical terms to preserve
-    medical_prefixes = [
-        'Tab\.?', 'Tablet', 'Cap\.?', 'Capsule', 'Syrup', 'Inj\.?', 'Injection', 
-        'Cream', 'Gel', 'Paint', 'Drop', 'Drops', 'Ointment', 'Lotion', 
-        'Suspension', 'Solution', 'Powder', 'Spray', 'Patch', 'Suppository',
-        'Rx\.?', 'Adv:', 'Advice:'
-    ]
-    
-    # Common medicine name patterns and ingredients to preserve
-    medicine_patterns = [
-        r'Tab\.?\s+\w+',  # Tab. [MedicineName]
-        r'Cap\.?\s+\w+',  # Cap. [MedicineName]
-        r'\w+(cillin|mycin|floxacin|prazole|tide|zole|pine|lam|tin|fen|ol)\b',  # Common drug suffixes
-        r'\w+\s+\d+(mg|mcg|g|ml|cc)',  # Medicine with dosage
-        r'\b(Augmentin|Enzoflam|Pand|Hexigel)\w*\b',  # Specific medicines from your text
-        r'\b\w*pain(t)?\b',  # gel paint, etc.
-    ]
-    
-    # Medical terms and dosages to preserve
-    medical_terms = [
-        r'\bmg\b', r'\bmcg\b', r'\bg\b', r'\bml\b', r'\bcc\b',
-        r'\bdays?\b', r'\bweeks?\b', r'\bmonths?\b',
-        r'\bmassage\b', r'\bmeals?\b', r'\bbefore\b', r'\bafter\b',
-        r'\bx\s*\d+', r'\d+\s*x\s*\d+', r'--\d+\s*x\s*\d+',
-        r'\bgum\b', r'\bpaint\b', r'\bgel\b'
-    ]
-    
-    # Create a list to store all medical terms found in text
-    protected_terms = set()
-    
-    # Find and protect all medical terms
-    for pattern in medicine_patterns:
-        matches = re.findall(pattern, text, re.IGNORECASE)
-        protected_terms.update(matches)
-    
-    # --- Remove phone numbers ---
-    text = re.sub(r"\+?\d[\d\-\s]{7,}\d", "[PHONE]", text)
-
-    # --- Remove emails ---
-    text = re.sub(r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b", "[EMAIL]", text)
-
-    # --- Remove websites ---
-    text = re.sub(r"(www\.[^\s]+|https?://[^\s]+)", "[WEB]", text)
-
-    # --- Remove explicit doctor titles and names (only when clearly marked) ---
-    text = re.sub(r"\b(Dr\.?|DR\.?|Doctor)\s+[A-Za-z]+(?:\s+[A-Za-z]+)*", "[DOCTOR_NAME]", text, flags=re.IGNORECASE)
-    
-    # --- Remove explicit patient titles and names (only when clearly marked) ---
-    text = re.sub(r"\b(Mr\.?|Mrs\.?|Ms\.?|Miss|Master)\s+[A-Za-z]+(?:\s+[A-Za-z]+)*", "[PATIENT_NAME]", text, flags=re.IGNORECASE)
-    
-    # --- Remove Me./Mme./Mlle. titles followed by names ---
-    text = re.sub(r"\b(Me\.)\s*[A-Za-z]+(?:\s+[A-Za-z]+)*", "[PATIENT_NAME]", text, flags=re.IGNORECASE)
-    
-    # --- Use spaCy NER but be very selective ---
-    doc = nlp(text)
-    for ent in doc.ents:
-        if ent.label_ == "PERSON":
-            # Only replace if it's NOT a medical term and NOT preceded by medical prefixes
-            ent_text = ent.text.strip()
-            
-            # Skip if it's a known medical term
-            is_medical = False
-            for med_pattern in medicine_patterns:
-                if re.search(med_pattern, ent_text, re.IGNORECASE):
-                    is_medical = True
-                    break
-            
-            # Skip if it contains medical dosage or common medical words
-            if (re.search(r'\d+(mg|mcg|g|ml|cc)', ent_text, re.IGNORECASE) or 
-                any(term in ent_text.lower() for term in ['tab', 'gel', 'paint', 'cream'])):
-                is_medical = True
-            
-            # Skip if it's already been processed or is clearly medical
-            if (not is_medical and 
-                "[" not in ent_text and 
-                not any(prefix.replace(r'\.?', '').lower() in text[max(0, text.find(ent_text)-10):text.find(ent_text)].lower() 
-                        for prefix in medical_prefixes)):
-                
-                # Additional check: only replace if it looks like a person name
-                # (standalone names that aren't part of medical context)
-                context_start = max(0, text.find(ent_text) - 20)
-                context_end = min(len(text), text.find(ent_text) + len(ent_text) + 20)
-                context = text[context_start:context_end].lower()
-                
-                # Don't replace if it's in medical context
-                if not any(med_word in context for med_word in ['tab', 'mg', 'gel', 'paint', 'cream', 'rx', 'adv']):
-                    text = text.replace(ent_text, "[PERSON_NAME]")
-                    
-        elif ent.label_ == "DATE":
-            text = text.replace(ent.text, "[DATE]")
-
-    # --- Remove age patterns ---
-    text = re.sub(r"\b\d{1,2}\s?(yrs|years|year|y|/m|/f)\b", "[AGE]", text, flags=re.IGNORECASE)
-    text = re.sub(r"Age[:\s]*\d{1,2}", "Age: [AGE]", text, flags=re.IGNORECASE)
-
-    # --- Remove patient ID numbers ---
-    text = re.sub(r"\bPatient\s+ID[:\s]*\w+", "Patient ID: [PATIENT_ID]", text, flags=re.IGNORECASE)
-    text = re.sub(r"\bID[:\s]*\d+", "ID: [ID]", text, flags=re.IGNORECASE)
-
-    return text
+def process_pdf_remotely(pdf_file) -> Union[dict, None]:
+    """Extract and anonymize the PDF on the processing service"""
+    try:
+        return ProcessingClient(PROCESSING_SERVICE_URL).run("anonymize", pdf_file.getvalue())
+    except Exception as e:
+        st.error(f"Processing service error: {e}")
+        return None
 
 def init_gemini(api_key):
     """Initialize the Gemini model"""
@@ -141,6 +61,22 @@ def init_gemini(api_key):
         st.error(f"Failed to initialize Gemini: {e}")
         return None
 
+@st.cache_resource
+def get_chat_store():
+    """One SQLite chat store per process"""
+    return SqliteChatStore(CHAT_DB_PATH)
+
+@st.cache_resource
+def get_redaction_cache():
+    """Anonymized PDFs by content hash, so the same file is never anonymized twice"""
+    return SqliteRedactionCache(CHAT_DB_PATH)
+
+@st.cache_resource
+def get_llm_gateway():
+    """One LLM gateway per process, shared by every session"""
+    default_backend = HttpBackend(LLM_BACKEND_URL) if LLM_BACKEND_URL else None
+    return LLMGateway(default_backend, rate=2.0, burst=5, max_concurrency=4, timeout=60.0, hedge_after=20.0)
+
 def chat_with_gemini(model, prompt, context):
     """Send a prompt to Gemini with the medical report context"""
     try:
@@ -156,9 +92,13 @@ def chat_with_gemini(model, prompt, context):
         
         Response:
         """
-        response = model.generate_content(full_prompt)
-        return response.text
+        backend = None if LLM_BACKEND_URL else GeminiBackend(model)
+        return get_llm_gateway().generate(full_prompt, backend=backend)
+    except LLMTimeoutError:
+        return "Gemini took too long to respond. Please try again."
     except Exception as e:
+        if is_rate_limited(e):
+            return "Gemini is rate limiting requests right now. Please wait a minute and try again."
         return f"Error communicating with Gemini: {e}"
 
 def count_tokens(text):
@@ -172,10 +112,8 @@ def calculate_total_tokens(cleaned_text, chat_history):
     # Count tokens for the medical report
     report_tokens = count_tokens(cleaned_text) if cleaned_text else 0
     
-    # Count tokens for all messages in chat history
-    chat_tokens = 0
-    for message in chat_history:
-        chat_tokens += count_tokens(message["content"])
+    # Count tokens for all messages in chat history (including paged-out ones)
+    chat_tokens = int(chat_history.word_count * 1.33)
     
     return report_tokens + chat_tokens
 
@@ -191,7 +129,7 @@ def main():
     if "cleaned_text" not in st.session_state:
         st.session_state.cleaned_text = None
     if "chat_history" not in st.session_state:
-        st.session_state.chat_history = []
+        st.session_state.chat_history = ChatHistory(get_chat_store(), window=CHAT_WINDOW, page_size=CHAT_WINDOW)
     if "gemini_model" not in st.session_state:
         st.session_state.gemini_model = None
     if "api_key" not in st.session_state:
@@ -294,15 +232,31 @@ def main():
             
             with col_process1:
                 if st.button("📝 Process PDF", type="primary"):
-                    with st.spinner("Extracting text from PDF..."):
-                        raw_text = extract_text_from_pdf(uploaded_file)
-                        
-                    if raw_text:
-                        with st.spinner("Anonymizing sensitive information..."):
-                            cleaned_text = clean_sensitive_info(raw_text)
-                            st.session_state.cleaned_text = cleaned_text
-                        
+                    digest = pdf_digest(uploaded_file.getvalue())
+                    cached = get_redaction_cache().get(digest)
+                    if cached:
+                        st.session_state.cleaned_text = cached["redacted_text"]
                         st.success("✅ PDF processed successfully!")
+                    elif PROCESSING_SERVICE_URL:
+                        with st.spinner("Extracting and anonymizing on the processing service..."):
+                            result = process_pdf_remotely(uploaded_file)
+                        
+                        if result:
+                            st.session_state.cleaned_text = result["cleaned_text"]
+                            get_redaction_cache().put(digest, result["cleaned_text"], result.get("spans", []),
+                                                      result.get("redaction_version"))
+                            st.success("✅ PDF processed successfully!")
+                    else:
+                        with st.spinner("Extracting text from PDF..."):
+                            raw_text = extract_text_from_pdf(uploaded_file)
+                            
+                        if raw_text:
+                            with st.spinner("Anonymizing sensitive information..."):
+                                cleaned_text, spans = redact(raw_text)
+                                st.session_state.cleaned_text = cleaned_text
+                                get_redaction_cache().put(digest, cleaned_text, spans, redaction_version())
+                            
+                            st.success("✅ PDF processed successfully!")
             
             with col_process2:
                 if st.session_state.cleaned_text:
@@ -357,7 +311,7 @@ def main():
             
             # Clear chat button
             if st.button("🗑️ Clear Chat History", type="secondary"):
-                st.session_state.chat_history = []
+                st.session_state.chat_history.clear()
                 st.rerun()
         
         # Chat container
@@ -365,9 +319,7 @@ def main():
         
         with chat_container:
             # Display chat history
-            for message in st.session_state.chat_history:
-                with st.chat_message(message["role"]):
-                    st.markdown(message["content"])
+            render_chat_history(st.session_state.chat_history, key="chat")
         
         # Chat input
         if st.session_state.cleaned_text and st.session_state.gemini_model:
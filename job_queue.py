@@ -0,0 +1,121 @@
+"""Postgres-backed job queue for the processing service (table processing_jobs).
+
+Workers claim jobs with FOR UPDATE SKIP LOCKED, so any number of worker
+processes on any number of machines can share one queue. Each claim gets a
+fresh token; the worker holding it sends heartbeats while the job runs, and
+only jobs whose heartbeats stopped are requeued. A worker that lost its claim
+(its job was requeued and claimed again) cannot finish or fail the job.
+"""
+import uuid
+
+from psycopg2 import Binary
+from psycopg2.extras import Json
+
+
+def enqueue_job(conn, kind, payload, pdf_bytes=None):
+    with conn.cursor() as cur:
+        cur.execute(
+            """INSERT INTO processing_jobs (kind, payload, pdf)
+            VALUES (%s, %s, %s) RETURNING id""",
+            (kind, Json(payload), Binary(pdf_bytes) if pdf_bytes is not None else None)
+        )
+        job_id = cur.fetchone()['id']
+    conn.commit()
+    return job_id
+
+
+def claim_job(conn):
+    """Mark the oldest queued job as running under a new claim_token and return it, or None if the queue is empty"""
+    with conn.cursor() as cur:
+        cur.execute(
+            """UPDATE processing_jobs
+            SET status = 'running', started_at = CURRENT_TIMESTAMP, heartbeat_at = CURRENT_TIMESTAMP,
+                claim_token = %s, attempts = attempts + 1
+            WHERE id = (
+                SELECT id FROM processing_jobs
+                WHERE status = 'queued'
+                ORDER BY id
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING *""",
+            (uuid.uuid4().hex,)
+        )
+        job = cur.fetchone()
+    conn.commit()
+    return job
+
+
+def heartbeat(conn, job_id, claim_token):
+    """Record that the worker holding `claim_token` is still running the job; False if it lost the claim"""
+    with conn.cursor() as cur:
+        cur.execute(
+            """UPDATE processing_jobs SET heartbeat_at = CURRENT_TIMESTAMP
+            WHERE id = %s AND claim_token = %s AND status = 'running'""",
+            (job_id, claim_token)
+        )
+        claimed = cur.rowcount == 1
+    conn.commit()
+    return claimed
+
+
+def finish_job(conn, job_id, claim_token, result):
+    """Store the job's result; False (and nothing stored) if the worker lost its claim"""
+    with conn.cursor() as cur:
+        cur.execute(
+            """UPDATE processing_jobs
+            SET status = 'done', result = %s, pdf = NULL, finished_at = CURRENT_TIMESTAMP
+            WHERE id = %s AND claim_token = %s AND status = 'running'""",
+            (Json(result), job_id, claim_token)
+        )
+        claimed = cur.rowcount == 1
+    conn.commit()
+    return claimed
+
+
+def fail_job(conn, job_id, claim_token, error):
+    """Mark the job failed; False (and nothing stored) if the worker lost its claim"""
+    with conn.cursor() as cur:
+        cur.execute(
+            """UPDATE processing_jobs
+            SET status = 'failed', error = %s, pdf = NULL, finished_at = CURRENT_TIMESTAMP
+            WHERE id = %s AND claim_token = %s AND status = 'running'""",
+            (error, job_id, claim_token)
+        )
+        claimed = cur.rowcount == 1
+    conn.commit()
+    return claimed
+
+
+def requeue_stale_jobs(conn, stale_after_seconds=120, max_attempts=3):
+    """Put jobs whose worker stopped sending heartbeats back in the queue; give up after max_attempts"""
+    with conn.cursor() as cur:
+        cur.execute(
+            """UPDATE processing_jobs
+            SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'queued' END,
+                error = CASE WHEN attempts >= %s THEN 'Worker stopped responding' ELSE error END,
+                finished_at = CASE WHEN attempts >= %s THEN CURRENT_TIMESTAMP ELSE finished_at END,
+                claim_token = NULL
+            WHERE status = 'running'
+            AND coalesce(heartbeat_at, started_at) < CURRENT_TIMESTAMP - make_interval(secs => %s)""",
+            (max_attempts, max_attempts, max_attempts, stale_after_seconds)
+        )
+        count = cur.rowcount
+    conn.commit()
+    return count
+
+
+def get_job(conn, job_id):
+    with conn.cursor() as cur:
+        cur.execute(
+            """SELECT id, kind, status, result, error, created_at, started_at, finished_at
+            FROM processing_jobs WHERE id = %s""",
+            (job_id,)
+        )
+        return cur.fetchone()
+
+
+def queue_depth(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT status, COUNT(*) AS count FROM processing_jobs GROUP BY status")
+        return {r['status']: r['count'] for r in cur.fetchall()}
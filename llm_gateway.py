@@ -0,0 +1,234 @@
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+
+class LLMError(Exception):
+    """Base error raised by the LLM gateway"""
+
+
+class RateLimitError(LLMError):
+    """The LLM provider rejected the call because of quota / rate limits"""
+
+
+class TransientLLMError(LLMError):
+    """Temporary provider failure (5xx, dropped connection) that is worth retrying"""
+
+
+class LLMTimeoutError(LLMError):
+    """The call did not finish before its deadline"""
+
+
+# Provider exception names that mean "try again later"
+RETRYABLE_ERROR_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable",
+    "DeadlineExceeded", "InternalServerError",
+}
+
+
+def is_retryable(exc):
+    """Return True if the error is a rate limit or a transient provider failure"""
+    if isinstance(exc, (RateLimitError, TransientLLMError, LLMTimeoutError, ConnectionError, TimeoutError)):
+        return True
+    if type(exc).__name__ in RETRYABLE_ERROR_NAMES:
+        return True
+    return getattr(exc, "code", None) in (429, 500, 503, 504)
+
+
+def is_rate_limited(exc):
+    """Return True if the error was caused by provider rate limiting"""
+    return (isinstance(exc, RateLimitError)
+            or type(exc).__name__ in ("ResourceExhausted", "TooManyRequests")
+            or getattr(exc, "code", None) == 429)
+
+
+class GeminiBackend:
+    """Calls Gemini through google.generativeai"""
+
+    def __init__(self, model='gemini-1.5-flash'):
+        if isinstance(model, str):
+            import google.generativeai as genai
+            model = genai.GenerativeModel(model)
+        self.model = model
+        self.name = f"gemini:{getattr(model, 'model_name', model)}"
+
+    def __call__(self, prompt, timeout):
+        response = self.model.generate_content(prompt, request_options={"timeout": timeout})
+        return response.text
+
+
+class HttpBackend:
+    """Calls a JSON endpoint: POST {"prompt": ...} -> {"text": ...}
+
+    Used to run the apps against a local fake server (see fake_llm_server.py).
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.name = f"http:{url}"
+
+    def __call__(self, prompt, timeout):
+        body = json.dumps({"prompt": prompt}).encode("utf-8")
+        request = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return json.loads(response.read().decode("utf-8"))["text"]
+        except urllib.error.HTTPError as e:
+            if e.code == 429:
+                raise RateLimitError(f"{self.url} returned 429") from e
+            if e.code >= 500:
+                raise TransientLLMError(f"{self.url} returned {e.code}") from e
+            raise
+        except (urllib.error.URLError, TimeoutError) as e:
+            raise TransientLLMError(f"{self.url} unreachable: {e}") from e
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, up to `capacity` stored"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def acquire(self, deadline):
+        """Block until a token is available; False if `deadline` passes first"""
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait_for = (1 - self.tokens) / self.rate
+            if time.monotonic() + wait_for > deadline:
+                return False
+            time.sleep(wait_for)
+
+
+class LLMGateway:
+    """Shared entry point for every LLM call made by the apps.
+
+    - identical in-flight prompts are coalesced into one provider call
+    - calls are throttled by a token bucket and a concurrency limit
+    - every call has a deadline; rate limits and transient errors are retried
+      with full-jitter exponential backoff inside that deadline
+    - optionally, a hedged duplicate is fired if the first attempt is slow
+    """
+
+    def __init__(self, backend, rate=2.0, burst=5, max_concurrency=4, timeout=60.0,
+                 max_retries=3, backoff_base=0.5, backoff_cap=8.0, hedge_after=None):
+        self.backend = backend
+        self.bucket = TokenBucket(rate, burst)
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.hedge_after = hedge_after
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency * 2, thread_name_prefix="llm")
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.stats = {"calls": 0, "coalesced": 0, "retries": 0, "hedges": 0}
+
+    def generate(self, prompt, backend=None, timeout=None):
+        """Return the model's text for `prompt`, sharing the result with identical concurrent calls"""
+        backend = backend or self.backend
+        deadline = time.monotonic() + (timeout or self.timeout)
+        key = (backend.name, prompt)
+
+        with self.lock:
+            future = self.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.inflight[key] = future
+            else:
+                self.stats["coalesced"] += 1
+
+        if leader:
+            try:
+                future.set_result(self._call_with_retries(backend, prompt, deadline))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self.lock:
+                    self.inflight.pop(key, None)
+
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except TimeoutError as e:
+            raise LLMTimeoutError("LLM call exceeded its deadline") from e
+
+    def _count(self, name):
+        # Called from executor threads as well as callers
+        with self.lock:
+            self.stats[name] += 1
+
+    def _call_with_retries(self, backend, prompt, deadline):
+        attempt = 0
+        while True:
+            try:
+                return self._call_once(backend, prompt, deadline)
+            except Exception as e:
+                attempt += 1
+                if not is_retryable(e) or attempt > self.max_retries:
+                    raise
+                delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+                if time.monotonic() + delay >= deadline:
+                    raise
+                self._count("retries")
+                time.sleep(delay)
+
+    def _call_once(self, backend, prompt, deadline):
+        if not self.bucket.acquire(deadline):
+            raise LLMTimeoutError("Timed out waiting for the LLM rate limiter")
+
+        attempts = [self.executor.submit(self._guarded_call, backend, prompt, deadline)]
+        if self.hedge_after is not None:
+            done, _ = wait(attempts, timeout=min(self.hedge_after, max(0.0, deadline - time.monotonic())))
+            # Only hedge when it does not eat into the rate budget of queued callers
+            if not done and time.monotonic() < deadline and self.bucket.try_acquire():
+                self._count("hedges")
+                attempts.append(self.executor.submit(self._guarded_call, backend, prompt, deadline))
+
+        pending = set(attempts)
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                raise LLMTimeoutError("LLM call exceeded its deadline")
+            for attempt in done:
+                if attempt.exception() is None:
+                    return attempt.result()
+                error = attempt.exception()
+        raise error
+
+    def _guarded_call(self, backend, prompt, deadline):
+        remaining = deadline - time.monotonic()
+        if not self.slots.acquire(timeout=max(0.0, remaining)):
+            raise LLMTimeoutError("Timed out waiting for a free LLM slot")
+        try:
+            self._count("calls")
+            return backend(prompt, max(0.1, deadline - time.monotonic()))
+        finally:
+            self.slots.release()
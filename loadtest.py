@@ -0,0 +1,288 @@
+"""Concurrent-session load test for app_timeline.py.
+
+Drives N simulated families through login -> member selection -> PDF upload ->
+chat using Streamlit's AppTest. All sessions run on threads of this one
+process against one shared runtime (see share_apptest_runtime), so they share
+the app's st.cache_resource DB connection and LLM gateway exactly like real
+sessions of one `streamlit run` process do. One warm-up run loads the app's
+imports and models before timing starts. Gemini is replaced by the local fake
+server (fake_llm_server.py) with configurable latency and failure rates.
+
+Point it at a disposable local Postgres with the HEALTH_AI_DB_* variables
+(see db.py); test families are created with phone numbers 55XXXXXXXX.
+
+    HEALTH_AI_DB_NAME=health_ai_load python loadtest.py --sessions 50 --concurrency 10 --llm-latency 1.5
+    python loadtest.py --sessions 20 --pdf samples/report.pdf --chat-messages 5
+"""
+import argparse
+import contextlib
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app_timeline.py")
+STEPS = ["open", "login", "select_member", "upload", "chat"]
+
+
+def minimal_pdf(lines):
+    """A one-page PDF with the given text lines, so the harness needs no sample files"""
+    stream = "BT /F1 11 Tf 50 800 Td 14 TL " + " ".join(
+        "(" + line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ") '" for line in lines
+    ) + " ET"
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R "
+        "/Resources << /Font << /F1 5 0 R >> >> >>",
+        f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    pdf = "%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n{body}\nendobj\n"
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    pdf += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    return pdf.encode("latin-1")
+
+
+SAMPLE_REPORT = minimal_pdf([
+    "CITY DIAGNOSTICS - LABORATORY REPORT",
+    "Test                 Result    Units    Reference",
+    "Haemoglobin          11.2      g/dL     13.0 - 17.0",
+    "HbA1c                7.4       %        4.0 - 5.6",
+    "Fasting blood sugar  142       mg/dL    70 - 100",
+    "Serum creatinine     1.1       mg/dL    0.7 - 1.3",
+    "Advice: Tab. Metformin 500mg twice daily after meals",
+])
+
+
+def seed_families(count):
+    """Create `count` test families with one member each; returns [(phone, member_id)]"""
+    import db
+
+    conn = db.connect()
+    db.init_schema(conn)
+    seeded = []
+    with conn.cursor() as cur:
+        for i in range(count):
+            phone = f"55{i:08d}"
+            cur.execute(
+                """INSERT INTO families (phone_number, head_name) VALUES (%s, %s)
+                ON CONFLICT (phone_number) DO UPDATE SET head_name = EXCLUDED.head_name
+                RETURNING id""",
+                (phone, f"Load Test {i}")
+            )
+            family_id = cur.fetchone()['id']
+            cur.execute("SELECT id FROM family_members WHERE family_id = %s ORDER BY id LIMIT 1", (family_id,))
+            member = cur.fetchone()
+            if member is None:
+                cur.execute(
+                    """INSERT INTO family_members (family_id, name, age, sex)
+                    VALUES (%s, %s, %s, %s) RETURNING id""",
+                    (family_id, f"Member {i}", 40, "Female")
+                )
+                member = cur.fetchone()
+            seeded.append((phone, member['id']))
+    conn.commit()
+    conn.close()
+    return seeded
+
+
+def step_failed(at):
+    """Error text if the script raised or showed st.error, else None"""
+    if at.exception:
+        return at.exception[0].message
+    if at.error:
+        return at.error[0].value
+    return None
+
+
+def run_session(phone, member_id, pdf_bytes, chat_messages, timeout):
+    """Run one simulated session; returns {step: (seconds, error or None)}"""
+    from streamlit.testing.v1 import AppTest
+
+    results = {}
+
+    def timed(step, action):
+        start = time.perf_counter()
+        try:
+            at = action()
+            error = step_failed(at)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        results[step] = (time.perf_counter() - start, error)
+        return error is None
+
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    if not timed("open", at.run):
+        return results
+
+    def login():
+        at.text_input[0].input(phone)
+        next(b for b in at.button if b.label == "Continue").click()
+        return at.run()
+
+    def select_member():
+        at.button(key=f"member_{member_id}").click()
+        return at.run()
+
+    def upload():
+        at.file_uploader(key=f"report_uploader_{member_id}").set_value(("report.pdf", pdf_bytes, "application/pdf"))
+        return at.run()
+
+    def chat():
+        for i in range(chat_messages):
+            at.chat_input(key="chat_input").set_value(f"Please show my report {i}")
+            at.run()
+            if step_failed(at):
+                break
+        return at
+
+    for step, action in [("login", login), ("select_member", select_member), ("upload", upload), ("chat", chat)]:
+        if not timed(step, action):
+            break
+    return results
+
+
+def share_apptest_runtime():
+    """Run every AppTest in this process on one Runtime, like the sessions of one server.
+
+    AppTest installs a fresh mock Runtime singleton for each run and clears it
+    when the run ends, so concurrent sessions knock each other's runtime out
+    ("Runtime hasn't been created!" inside the script thread). Here the
+    singleton lookups always return one shared runtime (one media, dataframe
+    and st.cache_data store, as in a server), and the appTest config flag is
+    set once for the process instead of patched and restored around each run.
+    """
+    from unittest.mock import MagicMock
+
+    from streamlit import config
+    from streamlit.components.v2.component_manager import BidiComponentManager
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.dataframe_source_manager import DataframeSourceManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.testing.v1 import app_test
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.dataframe_source_mgr = DataframeSourceManager()
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    runtime.bidi_component_registry = BidiComponentManager()
+    runtime.bidi_component_registry.discover_and_register_components(start_file_watching=False)
+    Runtime.instance = classmethod(lambda cls: runtime)
+    Runtime.exists = classmethod(lambda cls: True)
+
+    config.set_option("global.appTest", True)
+    app_test.patch_config_options = lambda overrides: contextlib.nullcontext()
+
+
+def warm_up(timeout):
+    """Run the app once so imports, the spaCy model and cached resources load before timing"""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout).run()
+    return step_failed(at)
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def report(all_results, sessions, wall_seconds):
+    print(f"\n{sessions} session(s) in {wall_seconds:.1f}s -> {sessions / wall_seconds:.2f} sessions/s\n")
+    print(f"{'step':<14} {'runs':>5} {'errors':>7} {'err %':>6} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'steps/s':>8}")
+    errors_seen = {}
+    for step in STEPS:
+        timings = [r[step][0] for r in all_results if step in r]
+        errors = [r[step][1] for r in all_results if step in r and r[step][1]]
+        for error in errors:
+            errors_seen[error[:120]] = errors_seen.get(error[:120], 0) + 1
+        runs = len(timings)
+        print(f"{step:<14} {runs:>5} {len(errors):>7} {100 * len(errors) / max(1, runs):>5.1f}% "
+              f"{percentile(timings, 50):>7.2f} {percentile(timings, 95):>7.2f} {percentile(timings, 99):>7.2f} "
+              f"{(runs - len(errors)) / wall_seconds:>8.2f}")
+    completed = sum(1 for r in all_results if len(r) == len(STEPS) and not any(e for _, e in r.values()))
+    print(f"\nCompleted without error: {completed}/{sessions} ({100 * completed / max(1, sessions):.1f}%)")
+    if errors_seen:
+        print("\nMost common errors:")
+        for error, count in sorted(errors_seen.items(), key=lambda item: -item[1])[:5]:
+            print(f"  {count:>4} x {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20, help="total simulated sessions")
+    parser.add_argument("--concurrency", type=int, default=10, help="sessions running at the same time")
+    parser.add_argument("--chat-messages", type=int, default=3)
+    parser.add_argument("--pdf", help="report to upload (default: a generated one-page lab report)")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="fake LLM mean latency in seconds")
+    parser.add_argument("--llm-jitter", type=float, default=0.2)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="fraction of 503s from the fake LLM")
+    parser.add_argument("--llm-rate-limit-rate", type=float, default=0.0, help="fraction of 429s from the fake LLM")
+    parser.add_argument("--llm-port", type=int, default=8765)
+    parser.add_argument("--step-timeout", type=float, default=120.0, help="AppTest timeout per step in seconds")
+    args = parser.parse_args()
+
+    from fake_llm_server import start_server
+
+    llm_server = start_server(args.llm_port, args.llm_latency, args.llm_jitter,
+                              args.llm_error_rate, args.llm_rate_limit_rate)
+    os.environ["LLM_BACKEND_URL"] = f"http://127.0.0.1:{args.llm_port}"
+
+    if args.pdf:
+        with open(args.pdf, "rb") as f:
+            pdf_bytes = f.read()
+    else:
+        pdf_bytes = SAMPLE_REPORT
+
+    try:
+        families = seed_families(args.sessions)
+    except Exception as e:
+        print(f"Could not prepare the database ({e}). Set HEALTH_AI_DB_* to a local Postgres.")
+        return 1
+
+    share_apptest_runtime()
+    error = warm_up(args.step_timeout)
+    if error:
+        print(f"The app failed to start: {error}")
+        return 1
+
+    lock = threading.Lock()
+    all_results = []
+
+    def session(index):
+        phone, member_id = families[index]
+        try:
+            result = run_session(phone, member_id, pdf_bytes, args.chat_messages, args.step_timeout)
+        except Exception:
+            traceback.print_exc()
+            result = {"open": (0.0, "session crashed")}
+        with lock:
+            all_results.append(result)
+            print(f"\rsessions finished: {len(all_results)}/{args.sessions}", end="", flush=True)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(session, range(args.sessions)))
+    wall_seconds = time.perf_counter() - start
+    llm_server.shutdown()
+
+    report(all_results, args.sessions, wall_seconds)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
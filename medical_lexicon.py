@@ -0,0 +1,130 @@
+"""Dictionary of drug and procedure names, compiled into an Aho-Corasick automaton.
+
+The lexicon is matched once over a whole document; the resulting spans go into a
+SpanIndex so the redaction step can ask "does this entity touch a medical term?"
+in O(1) instead of re-scanning the text per entity.
+"""
+import os
+from collections import deque
+from functools import lru_cache
+
+DEFAULT_LEXICON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "medical_terms.txt")
+
+
+def _fold(ch):
+    """Lower-case one character without changing the text length"""
+    folded = ch.lower()
+    return folded if len(folded) == 1 else ch
+
+
+class Lexicon:
+    """Aho-Corasick automaton over case-insensitive, whole-word terms"""
+
+    def __init__(self, terms):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]  # lengths of the terms ending at each state
+        self.size = 0
+        for term in terms:
+            self._add(term)
+        self._build_failure_links()
+
+    def _add(self, term):
+        term = " ".join(term.split())
+        if not term:
+            return
+        state = 0
+        for ch in term:
+            ch = _fold(ch)
+            next_state = self.goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][ch] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(())
+            state = next_state
+        if len(term) not in self.output[state]:
+            self.output[state] = self.output[state] + (len(term),)
+            self.size += 1
+
+    def _build_failure_links(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(ch, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def find_spans(self, text):
+        """Yield (start, end) for every whole-word term occurrence in `text`"""
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for i, ch in enumerate(text):
+            ch = _fold(ch)
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length in output[state]:
+                start, end = i + 1 - length, i + 1
+                if (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum()):
+                    yield start, end
+
+    def __len__(self):
+        return self.size
+
+
+def lexicon_path(path=None):
+    return path or os.environ.get("MEDICAL_LEXICON_PATH", DEFAULT_LEXICON_PATH)
+
+
+def load_lexicon(path=None):
+    """Build a Lexicon from a text file with one term per line ('#' starts a comment)"""
+    with open(lexicon_path(path), encoding="utf-8") as f:
+        terms = [line.split("#", 1)[0].strip() for line in f]
+    return Lexicon(term for term in terms if term)
+
+
+class SpanIndex:
+    """Set of character spans over a text of known length, with O(1) overlap queries"""
+
+    def __init__(self, length):
+        self.length = length
+        self.delta = [0] * (length + 1)
+        self.covered = None
+
+    def add(self, start, end):
+        start, end = max(0, start), min(self.length, end)
+        if start < end:
+            self.delta[start] += 1
+            self.delta[end] -= 1
+            self.covered = None
+
+    def add_all(self, spans):
+        for start, end in spans:
+            self.add(start, end)
+
+    def _freeze(self):
+        # covered[i] = number of covered characters in text[:i]
+        covered = [0] * (self.length + 1)
+        depth = 0
+        for i in range(self.length):
+            depth += self.delta[i]
+            covered[i + 1] = covered[i] + (depth > 0)
+        self.covered = covered
+
+    def overlaps(self, start, end):
+        if self.covered is None:
+            self._freeze()
+        start, end = max(0, start), min(self.length, end)
+        return start < end and self.covered[end] - self.covered[start] > 0
+
+
+@lru_cache(maxsize=1)
+def default_lexicon():
+    """The lexicon at MEDICAL_LEXICON_PATH (or medical_terms.txt), compiled once per process"""
+    return load_lexicon()
@@ -0,0 +1,160 @@
+"""Migrate medical_reports to yearly range partitions and archive cold years.
+
+New databases get the partitioned table straight from db.init_schema; this
+script converts an existing single-table medical_reports in one transaction,
+then manages the partitions:
+
+    python partition_reports.py migrate               # heap table -> partitioned
+    python partition_reports.py list
+    python partition_reports.py archive --before 2018 [--tablespace cold_storage]
+    python partition_reports.py restore 2016
+
+Archiving detaches each year before --before and moves it to the "archive"
+schema (and optionally a cheaper tablespace). The apps and workers then no
+longer see or vacuum those reports; restore re-attaches a year.
+"""
+import argparse
+import sys
+from datetime import date
+
+import db
+
+ARCHIVE_SCHEMA = db.ARCHIVE_SCHEMA
+
+
+def is_partitioned(cur):
+    cur.execute("SELECT relkind = 'p' AS partitioned FROM pg_class WHERE oid = 'medical_reports'::regclass")
+    return cur.fetchone()['partitioned']
+
+
+def migrate(conn, keep_heap=False):
+    """Copy a heap medical_reports into a partitioned one; returns the number of reports moved"""
+    with conn.cursor() as cur:
+        if is_partitioned(cur):
+            return 0
+        cur.execute("LOCK TABLE medical_reports IN ACCESS EXCLUSIVE MODE")
+        for statement in db.REDACTION_COLUMNS + db.REPORT_JOB_COLUMNS:
+            cur.execute(statement)
+        # The partition key is part of the primary key, so it cannot be NULL
+        cur.execute("UPDATE medical_reports SET report_date = coalesce(created_at::date, CURRENT_DATE) WHERE report_date IS NULL")
+        cur.execute("ALTER TABLE IF EXISTS report_insights DROP CONSTRAINT IF EXISTS report_insights_report_id_fkey")
+
+        cur.execute("ALTER TABLE medical_reports RENAME TO medical_reports_heap")
+        cur.execute("ALTER INDEX IF EXISTS medical_reports_pkey RENAME TO medical_reports_heap_pkey")
+        cur.execute("ALTER INDEX IF EXISTS medical_reports_search_idx RENAME TO medical_reports_heap_search_idx")
+        cur.execute("ALTER INDEX IF EXISTS medical_reports_member_date_idx RENAME TO medical_reports_heap_member_date_idx")
+        cur.execute("ALTER INDEX IF EXISTS medical_reports_job_idx RENAME TO medical_reports_heap_job_idx")
+        cur.execute("ALTER INDEX IF EXISTS medical_reports_member_search_idx RENAME TO medical_reports_heap_member_search_idx")
+
+        cur.execute(db.MEDICAL_REPORTS_TABLE)
+        cur.execute("ALTER TABLE medical_reports ADD COLUMN search_vector tsvector")
+        cur.execute("SELECT DISTINCT extract(year FROM report_date)::int AS year FROM medical_reports_heap")
+        years = {r['year'] for r in cur.fetchall()} | {date.today().year}
+        for year in sorted(years):
+            db.ensure_report_partition(cur, date(year, 1, 1))
+
+        cur.execute(
+            """INSERT INTO medical_reports (id, member_id, report_text, redacted_text, redaction_spans,
+                                         redaction_version, job_id, report_date, created_at, search_vector)
+            SELECT id, member_id, report_text, redacted_text, redaction_spans, redaction_version, job_id,
+                   report_date, created_at, to_tsvector(%s, coalesce(report_text, ''))
+            FROM medical_reports_heap""",
+            (db.SEARCH_CONFIG,)
+        )
+        moved = cur.rowcount
+        cur.execute(
+            """SELECT setval(pg_get_serial_sequence('medical_reports', 'id'),
+                             (SELECT coalesce(max(id), 0) + 1 FROM medical_reports_heap), false)"""
+        )
+        if not keep_heap:
+            cur.execute("DROP TABLE medical_reports_heap")
+    conn.commit()
+    # Builds the member/date and search indexes on every partition
+    db.init_schema(conn)
+    return moved
+
+
+def list_partitions(conn):
+    """Attached and archived yearly partitions as [{name, schema, bounds, reports, size}]"""
+    with conn.cursor() as cur:
+        cur.execute(
+            """SELECT c.relname AS name, n.nspname AS schema,
+                      pg_get_expr(c.relpartbound, c.oid) AS bounds,
+                      c.reltuples::bigint AS reports,
+                      pg_size_pretty(pg_total_relation_size(c.oid)) AS size
+            FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE c.relname ~ '^medical_reports_[0-9]{4}$' AND c.relkind = 'r'
+            ORDER BY c.relname, n.nspname"""
+        )
+        return cur.fetchall()
+
+
+def archive(conn, before_year, tablespace=None):
+    """Detach every attached year before `before_year` into the archive schema; returns their names"""
+    archived = []
+    with conn.cursor() as cur:
+        cur.execute(db.PARTITION_LOCK)
+        cur.execute(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}")
+        cur.execute(
+            """SELECT c.relname AS name FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'medical_reports'::regclass ORDER BY c.relname"""
+        )
+        for row in cur.fetchall():
+            name = row['name']
+            if not name[-4:].isdigit() or int(name[-4:]) >= before_year:
+                continue
+            cur.execute(f"ALTER TABLE medical_reports DETACH PARTITION {name}")
+            cur.execute(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}")
+            if tablespace:
+                cur.execute(f"ALTER TABLE {ARCHIVE_SCHEMA}.{name} SET TABLESPACE {tablespace}")
+            archived.append(name)
+    conn.commit()
+    return archived
+
+
+def restore(conn, year):
+    """Re-attach an archived year to medical_reports"""
+    name = db.report_partition_name(year)
+    with conn.cursor() as cur:
+        cur.execute(db.PARTITION_LOCK)
+        cur.execute(f"ALTER TABLE {ARCHIVE_SCHEMA}.{name} SET SCHEMA public")
+        cur.execute(
+            f"ALTER TABLE medical_reports ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)",
+            (date(year, 1, 1), date(year + 1, 1, 1))
+        )
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = commands.add_parser("migrate", help="convert medical_reports to yearly partitions")
+    migrate_parser.add_argument("--keep-heap", action="store_true", help="keep the old table as medical_reports_heap")
+    commands.add_parser("list", help="show attached and archived partitions")
+    archive_parser = commands.add_parser("archive", help="detach old years into the archive schema")
+    archive_parser.add_argument("--before", type=int, required=True, help="archive years before this one")
+    archive_parser.add_argument("--tablespace", help="also move archived years to this tablespace")
+    restore_parser = commands.add_parser("restore", help="re-attach an archived year")
+    restore_parser.add_argument("year", type=int)
+    args = parser.parse_args()
+
+    conn = db.connect()
+    try:
+        if args.command == "migrate":
+            print(f"Moved {migrate(conn, args.keep_heap)} report(s) into partitioned medical_reports")
+        elif args.command == "list":
+            for p in list_partitions(conn):
+                print(f"{p['schema']}.{p['name']:<22} {p['bounds'] or 'detached':<52} ~{p['reports']:>10} rows {p['size']:>10}")
+        elif args.command == "archive":
+            archived = archive(conn, args.before, args.tablespace)
+            print(f"Archived {len(archived)} partition(s): {', '.join(archived) or '-'}")
+        elif args.command == "restore":
+            restore(conn, args.year)
+            print(f"Restored {db.report_partition_name(args.year)}")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
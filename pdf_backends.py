@@ -0,0 +1,143 @@
+"""Pluggable PDF text extraction.
+
+Backends are tried fastest first; a backend is only used if its library is
+installed. Set PDF_EXTRACT_BACKEND to force one (pypdfium2, pypdf, PyPDF2,
+pdfminer). Otherwise the fastest backend runs and, if its text looks broken
+(almost empty pages, "(cid:..)" glyph codes, words run together), the next one
+is tried and the better-looking result is kept.
+"""
+import importlib.util
+import io
+import os
+import re
+
+
+class ExtractionBackend:
+    name = ""
+    module = ""
+
+    def available(self):
+        return importlib.util.find_spec(self.module) is not None
+
+    def extract_pages(self, pdf_bytes):
+        raise NotImplementedError
+
+
+class PyPDF2Backend(ExtractionBackend):
+    name = "PyPDF2"
+    module = "PyPDF2"
+
+    def extract_pages(self, pdf_bytes):
+        import PyPDF2
+        pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
+        return [page.extract_text() or "" for page in pdf_reader.pages]
+
+
+class PypdfBackend(ExtractionBackend):
+    name = "pypdf"
+    module = "pypdf"
+
+    def extract_pages(self, pdf_bytes):
+        import pypdf
+        pdf_reader = pypdf.PdfReader(io.BytesIO(pdf_bytes))
+        return [page.extract_text() or "" for page in pdf_reader.pages]
+
+
+class PdfminerBackend(ExtractionBackend):
+    name = "pdfminer"
+    module = "pdfminer"
+
+    def extract_pages(self, pdf_bytes):
+        from pdfminer.high_level import extract_pages
+        from pdfminer.layout import LTTextContainer
+        return [
+            "".join(element.get_text() for element in page if isinstance(element, LTTextContainer))
+            for page in extract_pages(io.BytesIO(pdf_bytes))
+        ]
+
+
+class Pypdfium2Backend(ExtractionBackend):
+    name = "pypdfium2"
+    module = "pypdfium2"
+
+    def extract_pages(self, pdf_bytes):
+        import pypdfium2 as pdfium
+        pdf = pdfium.PdfDocument(pdf_bytes)
+        try:
+            pages = []
+            for page in pdf:
+                text_page = page.get_textpage()
+                # pdfium ends lines with \r\n; the other backends and the redaction rules use \n
+                pages.append(text_page.get_text_range().replace("\r\n", "\n").replace("\r", "\n"))
+                text_page.close()
+                page.close()
+            return pages
+        finally:
+            pdf.close()
+
+
+# Fastest first (see bench_pdf_backends.py)
+BACKENDS = [Pypdfium2Backend(), PyPDF2Backend(), PypdfBackend(), PdfminerBackend()]
+
+CID_RE = re.compile(r"\(cid:\d{1,6}\)")
+# Pages with fewer visible characters than this look like scans without a text
+# layer; a genuine short report (a single lab value, a one-line note) has more
+MIN_CHARS_PER_PAGE = 20
+WORD_RE = re.compile(r"\S{1,200}")
+
+
+def available_backends():
+    return [backend for backend in BACKENDS if backend.available()]
+
+
+def get_backend(name):
+    for backend in BACKENDS:
+        if backend.name.lower() == name.lower():
+            if not backend.available():
+                raise ValueError(f"PDF backend {backend.name} is not installed")
+            return backend
+    raise ValueError(f"Unknown PDF backend {name!r}; choose from {[b.name for b in BACKENDS]}")
+
+
+def text_quality(pages):
+    """Score in [0, 1] for how usable extracted text looks (1 = clean prose)"""
+    text = "".join(pages)
+    if not pages or not text.strip():
+        return 0.0
+    words = WORD_RE.findall(text)
+    visible_chars = sum(map(len, words))
+    mean_word_length = visible_chars / max(1, len(words))
+    garbage = len(CID_RE.findall(text)) * 8 + text.count("�")
+    score = min(1.0, visible_chars / len(pages) / MIN_CHARS_PER_PAGE)
+    if mean_word_length > 12:
+        # Missing spaces: words run together
+        score *= 12 / mean_word_length
+    return score * max(0.0, 1 - garbage / len(text))
+
+
+def extract_pages(pdf_bytes, backend=None, min_quality=0.6):
+    """Return (backend name, page texts) using the configured or heuristically best backend"""
+    backend = backend or os.environ.get("PDF_EXTRACT_BACKEND")
+    if backend:
+        chosen = get_backend(backend) if isinstance(backend, str) else backend
+        return chosen.name, chosen.extract_pages(pdf_bytes)
+
+    candidates = available_backends()
+    if not candidates:
+        raise RuntimeError("No PDF extraction library is installed")
+
+    best = None
+    for candidate in candidates:
+        try:
+            pages = candidate.extract_pages(pdf_bytes)
+        except Exception:
+            continue
+        quality = text_quality(pages)
+        if best is None or quality > best[0]:
+            best = (quality, candidate.name, pages)
+        if quality >= min_quality:
+            break
+    if best is None:
+        # Every backend failed; let the fastest one raise its error
+        return candidates[0].name, candidates[0].extract_pages(pdf_bytes)
+    return best[1], best[2]
@@ -0,0 +1,60 @@
+"""The report pipeline without any Streamlit: extract -> anonymize -> persist -> insight.
+
+Used by the processing service workers; the Streamlit apps keep thin wrappers
+that add their error messages on top.
+"""
+import db
+import pdf_backends
+from ingest import ingest_report, prompt_texts, redact_text, redaction_version
+from insights import INLINE_INSIGHT_DELAY, generate_insight, store_insight
+
+
+def extract_pages(pdf_bytes):
+    """Text of every page of a PDF, from the configured or fastest suitable backend"""
+    _, pages = pdf_backends.extract_pages(pdf_bytes)
+    return pages
+
+
+def extract_text(pdf_bytes):
+    return "".join(page_text + "\n" for page_text in extract_pages(pdf_bytes))
+
+
+def anonymize_pdf(pdf_bytes):
+    """Extract and anonymize a PDF (jj.py's "Process PDF")"""
+    text = "".join(page_text + "\n\n" for page_text in extract_pages(pdf_bytes)).strip()
+    if not text:
+        raise ValueError("Could not extract text from the PDF")
+    cleaned_text, spans = redact_text(text)
+    return {"cleaned_text": cleaned_text, "spans": spans, "redaction_version": redaction_version()}
+
+
+def process_report(conn, gateway, member_id, pdf_bytes, report_date=None, job_id=None):
+    """Extract a report, store it with its anonymized copy and store its insight (app_timeline.py's upload).
+
+    Only anonymized text goes into the prompt. An insight failure does not fail
+    the job: the report is kept and the error returned, and the insights batch
+    worker will retry it later. A retried `job_id` whose report was already
+    stored reuses that report instead of storing a duplicate.
+    """
+    report = db.fetch_report_for_job(conn, job_id) if job_id is not None else None
+    if report is None:
+        report_text = extract_text(pdf_bytes)
+        if not report_text.strip():
+            raise ValueError("Could not extract text from the PDF")
+
+    previous_reports = db.fetch_medical_reports(conn, member_id)
+    if report is not None:
+        previous_reports = [r for r in previous_reports if r['id'] != report['id']]
+    previous_texts = prompt_texts(conn, previous_reports) or None
+    if report is None:
+        report = ingest_report(conn, member_id, report_text, report_date, job_id=job_id,
+                               insight_delay=INLINE_INSIGHT_DELAY)
+
+    result = {"report_id": report['id'], "previous_count": len(previous_reports), "insight": None, "insight_error": None}
+    try:
+        result["insight"] = generate_insight(gateway, report['redacted_text'], previous_texts)
+        store_insight(conn, report['id'], result["insight"], gateway.backend.name)
+    except Exception as e:
+        conn.rollback()
+        result["insight_error"] = str(e)
+    return result
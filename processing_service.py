@@ -0,0 +1,250 @@
+"""Headless processing service for the report pipeline.
+
+The HTTP front end only queues jobs in Postgres; worker processes claim them and
+run extract -> anonymize -> persist -> insight. Fronts and workers scale
+independently: start more worker processes on this machine with --processes,
+or run `work` on other machines pointed at the same database.
+
+    python processing_service.py serve --port 8600          # HTTP API only
+    python processing_service.py work --processes 4         # workers only
+    python processing_service.py all --processes 4          # both
+
+API:
+    POST /jobs      {"kind": "report", "member_id": 1, "pdf_base64": "...",
+                     "report_date": "2024-05-01"}
+                    {"kind": "anonymize", "pdf_base64": "..."}
+                    -> 202 {"id": 17}
+    GET  /jobs/17   -> {"id": 17, "status": "queued|running|done|failed", "result": {...}, "error": null}
+    GET  /health    -> {"queue": {"queued": 3, "running": 2, ...}}
+"""
+import argparse
+import base64
+import binascii
+import contextlib
+import json
+import multiprocessing
+import re
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import db
+import job_queue
+
+JOB_KINDS = ("report", "anonymize")
+
+# A running job's worker refreshes heartbeat_at this often; jobs silent for
+# STALE_AFTER seconds are requeued (see job_queue.requeue_stale_jobs)
+HEARTBEAT_INTERVAL = 15.0
+STALE_AFTER = 120.0
+
+
+def run_job(conn, gateway, job):
+    import pipeline
+
+    pdf_bytes = bytes(job['pdf'])
+    payload = job['payload']
+    if job['kind'] == "anonymize":
+        return pipeline.anonymize_pdf(pdf_bytes)
+    return pipeline.process_report(
+        conn, gateway, payload['member_id'], pdf_bytes,
+        report_date=payload.get('report_date'), job_id=job['id']
+    )
+
+
+def close_quietly(conn):
+    if conn is not None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def heartbeat_loop(job_id, claim_token, stop):
+    """Refresh the job's heartbeat until `stop` is set, on its own connection (the worker's is mid-transaction)"""
+    conn = None
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        try:
+            if conn is None or conn.closed:
+                conn = db.connect()
+            if not job_queue.heartbeat(conn, job_id, claim_token):
+                break
+        except Exception:
+            traceback.print_exc()
+            close_quietly(conn)
+            conn = None
+    close_quietly(conn)
+
+
+def run_next_job(conn, gateway):
+    """Claim and run one job; False if the queue was empty"""
+    job = job_queue.claim_job(conn)
+    if job is None:
+        return False
+    stop = threading.Event()
+    threading.Thread(target=heartbeat_loop, args=(job['id'], job['claim_token'], stop), daemon=True).start()
+    try:
+        try:
+            result = run_job(conn, gateway, job)
+        except Exception as e:
+            conn.rollback()
+            traceback.print_exc()
+            job_queue.fail_job(conn, job['id'], job['claim_token'], str(e))
+        else:
+            job_queue.finish_job(conn, job['id'], job['claim_token'], result)
+    finally:
+        stop.set()
+    return True
+
+
+def worker_loop(poll_interval=1.0):
+    """Claim and run jobs forever; one spaCy model, LLM gateway and DB connection per process"""
+    from anonymizer import get_nlp
+    from insights import make_default_gateway
+
+    gateway = make_default_gateway()
+    get_nlp()
+    conn = None
+    while True:
+        try:
+            if conn is None or conn.closed:
+                conn = db.connect()
+            if not run_next_job(conn, gateway):
+                time.sleep(poll_interval)
+        except Exception:
+            # Lost the database, possibly mid-job: its heartbeats stop and it is
+            # requeued. Reconnect and keep going.
+            traceback.print_exc()
+            close_quietly(conn)
+            conn = None
+            time.sleep(poll_interval)
+
+
+def requeue_loop(interval=60.0):
+    """Requeue jobs whose worker stopped sending heartbeats, forever"""
+    conn = None
+    while True:
+        try:
+            if conn is None or conn.closed:
+                conn = db.connect()
+            job_queue.requeue_stale_jobs(conn, STALE_AFTER)
+        except Exception:
+            traceback.print_exc()
+            close_quietly(conn)
+            conn = None
+        time.sleep(interval)
+
+
+def start_workers(processes):
+    workers = [multiprocessing.Process(target=worker_loop, daemon=True) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    # ThreadingHTTPServer starts a thread per request, so connections come from
+    # a pool shared by all of them (set by serve); `slots` makes requests wait
+    # for a free connection instead of failing when the pool is exhausted
+    pool = None
+    slots = None
+
+    @contextlib.contextmanager
+    def db_connection(self):
+        """A pooled connection for one request; putconn rolls back anything left open and drops broken ones"""
+        with self.slots:
+            conn = self.pool.getconn()
+            try:
+                yield conn
+            finally:
+                self.pool.putconn(conn, close=bool(conn.closed))
+
+    def do_POST(self):
+        if self.path != "/jobs":
+            return self._reply(404, {"error": "Not found"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length))
+            pdf_bytes = base64.b64decode(payload.pop("pdf_base64"), validate=True)
+            kind = payload.pop("kind")
+        except (ValueError, KeyError, binascii.Error) as e:
+            return self._reply(400, {"error": f"Invalid job request: {e}"})
+        if kind not in JOB_KINDS:
+            return self._reply(400, {"error": f"Unknown job kind {kind!r}"})
+        if kind == "report" and "member_id" not in payload:
+            return self._reply(400, {"error": "report jobs need a member_id"})
+
+        try:
+            with self.db_connection() as conn:
+                job_id = job_queue.enqueue_job(conn, kind, payload, pdf_bytes)
+        except Exception as e:
+            return self._reply(500, {"error": f"Could not queue job: {e}"})
+        self._reply(202, {"id": job_id})
+
+    def do_GET(self):
+        match = re.fullmatch(r"/jobs/(\d{1,18})", self.path)
+        if not match and self.path != "/health":
+            return self._reply(404, {"error": "Not found"})
+        try:
+            with self.db_connection() as conn:
+                if match:
+                    job = job_queue.get_job(conn, int(match.group(1)))
+                else:
+                    depth = job_queue.queue_depth(conn)
+                conn.commit()
+        except Exception as e:
+            return self._reply(500, {"error": str(e)})
+        if not match:
+            return self._reply(200, {"queue": depth})
+        if job is None:
+            return self._reply(404, {"error": "No such job"})
+        self._reply(200, job)
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host, port, db_connections=10):
+    conn = db.connect()
+    db.init_schema(conn)
+    conn.close()
+    JobRequestHandler.pool = db.connect_pool(1, db_connections)
+    JobRequestHandler.slots = threading.BoundedSemaphore(db_connections)
+    server = ThreadingHTTPServer((host, port), JobRequestHandler)
+    print(f"Processing service listening on http://{host}:{port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", choices=["serve", "work", "all"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count(),
+                        help="worker processes to start (work/all)")
+    parser.add_argument("--db-connections", type=int, default=10,
+                        help="Postgres connections shared by the HTTP front's request threads (serve/all)")
+    args = parser.parse_args()
+
+    # Every front and worker host checks for stale jobs; requeueing twice is harmless
+    threading.Thread(target=requeue_loop, daemon=True).start()
+    if args.mode in ("work", "all"):
+        conn = db.connect()
+        db.init_schema(conn)
+        conn.close()
+        workers = start_workers(args.processes)
+        print(f"Started {len(workers)} worker process(es)")
+    if args.mode in ("serve", "all"):
+        serve(args.host, args.port, args.db_connections)
+    else:
+        for worker in workers:
+            worker.join()
@@ -0,0 +1,81 @@
+"""Regex rules used by clean_sensitive_info.
+
+Every pattern has a bounded match length, so each start position costs a
+constant amount of work and a full scan is linear in the document size even on
+adversarial or OCR-garbled text. stress_redaction.py checks this.
+"""
+import re
+
+# spaCy model whose entities anonymizer.redact() acts on
+NLP_MODEL = "en_core_web_sm"
+
+# Bump when anonymizer.redact() changes in a way the rules below do not show;
+# stored redactions from other versions are redone (see ingest.redaction_version)
+REDACTION_LOGIC_VERSION = 1
+
+# A capitalised name word ("Sharma", "O'Neil", "R.") and up to four of them
+NAME_WORD = r"[A-Z][A-Za-z'\-]{0,29}\.?"
+NAME_SEQUENCE = rf"{NAME_WORD}(?:[ \t]{{1,3}}{NAME_WORD}){{0,3}}"
+
+# (name, pattern, replacement) applied before spaCy NER
+PRE_NER_RULES = [
+    # --- Remove phone numbers ---
+    ("phone", re.compile(r"\+?\d[\d\-\s]{7,18}\d"), "[PHONE]"),
+    # --- Remove emails ---
+    ("email", re.compile(r"\b[A-Za-z0-9._%+-]{1,64}@(?:[A-Za-z0-9-]{1,63}\.){1,8}[A-Za-z]{2,24}\b"), "[EMAIL]"),
+    # --- Remove websites ---
+    ("website", re.compile(r"www\.\S{1,2048}|https?://\S{1,2048}"), "[WEB]"),
+    # --- Remove explicit doctor titles and names (only when clearly marked) ---
+    ("doctor", re.compile(rf"\b(?i:Dr\.?|Doctor)[ \t]{{1,3}}{NAME_SEQUENCE}"), "[DOCTOR_NAME]"),
+    # --- Remove explicit patient titles and names (only when clearly marked) ---
+    ("patient", re.compile(rf"\b(?i:Mr\.?|Mrs\.?|Ms\.?|Miss|Master)[ \t]{{1,3}}{NAME_SEQUENCE}"), "[PATIENT_NAME]"),
+    # --- Remove Me. titles followed by names ---
+    ("me_title", re.compile(rf"\bMe\.[ \t]{{0,3}}{NAME_SEQUENCE}"), "[PATIENT_NAME]"),
+]
+
+# (name, pattern, replacement) applied after spaCy NER
+POST_NER_RULES = [
+    # --- Remove age patterns ---
+    ("age_suffix", re.compile(r"\b\d{1,2}\s?(yrs|years|year|y|/m|/f)\b", re.IGNORECASE), "[AGE]"),
+    ("age_label", re.compile(r"\bAge[:\s]{0,5}\d{1,2}", re.IGNORECASE), "Age: [AGE]"),
+    # --- Remove patient ID numbers ---
+    ("patient_id", re.compile(r"\bPatient\s{1,3}ID[:\s]{0,5}\w{1,30}", re.IGNORECASE), "Patient ID: [PATIENT_ID]"),
+    ("id", re.compile(r"\bID[:\s]{0,5}\d{1,20}", re.IGNORECASE), "ID: [ID]"),
+]
+
+# Medication prefixes; a name right after one of these is not redacted
+MEDICAL_PREFIXES = [
+    'Tab', 'Tablet', 'Cap', 'Capsule', 'Syrup', 'Inj', 'Injection',
+    'Cream', 'Gel', 'Paint', 'Drop', 'Drops', 'Ointment', 'Lotion',
+    'Suspension', 'Solution', 'Powder', 'Spray', 'Patch', 'Suppository',
+    'Rx', 'Adv:', 'Advice:'
+]
+MEDICAL_PREFIX_RE = re.compile("|".join(re.escape(prefix.lower()) for prefix in MEDICAL_PREFIXES))
+
+# Common medicine name patterns and ingredients to preserve
+MEDICINE_PATTERNS = [
+    re.compile(r"\bTab\.?\s{1,3}\w{1,40}", re.IGNORECASE),  # Tab. [MedicineName]
+    re.compile(r"\bCap\.?\s{1,3}\w{1,40}", re.IGNORECASE),  # Cap. [MedicineName]
+    re.compile(r"\b\w{1,40}(?:cillin|mycin|floxacin|prazole|tide|zole|pine|lam|tin|fen|ol)\b", re.IGNORECASE),  # Common drug suffixes
+    re.compile(r"\b\w{1,40}\s{1,3}\d{1,6}(?:mg|mcg|g|ml|cc)", re.IGNORECASE),  # Medicine with dosage
+    re.compile(r"\d{1,6}(?:mg|mcg|g|ml|cc)", re.IGNORECASE),  # Bare dosage
+    re.compile(r"\b\w{0,40}paint?\b", re.IGNORECASE),  # gel paint, etc.
+]
+
+# Words that mark the text around a name as medical (matched on lower-cased text)
+MEDICAL_CONTEXT_RE = re.compile(r"tab|mg|gel|paint|cream|rx|adv")
+
+
+def apply_rules(text, rules):
+    """Apply (name, pattern, replacement) rules in order"""
+    for _, pattern, replacement in rules:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def all_patterns():
+    """Every compiled pattern the redaction step runs, as (name, pattern) pairs"""
+    patterns = [(name, pattern) for name, pattern, _ in PRE_NER_RULES + POST_NER_RULES]
+    patterns += [(f"medicine_{i}", pattern) for i, pattern in enumerate(MEDICINE_PATTERNS)]
+    patterns += [("medical_context", MEDICAL_CONTEXT_RE), ("medical_prefix", MEDICAL_PREFIX_RE)]
+    return patterns
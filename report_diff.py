@@ -0,0 +1,107 @@
+"""Compare a report with the member's previous one so prompts carry only what changed.
+
+Consecutive lab reports from the same lab are mostly identical boilerplate
+(headers, reference ranges, method notes). For the sequential analysis the LLM
+only needs the lines that changed, with measured values paired up as
+"HbA1c: 7.4 -> 6.9", plus a compact trend of each value over older reports.
+"""
+import difflib
+import re
+
+NUMBER_RE = re.compile(r"[<>]?-?\d{1,7}(?:\.\d{1,4})?")
+
+# Below this line similarity the reports are different kinds of document and a
+# diff would be longer than the previous report itself
+MIN_SIMILARITY = 0.3
+
+
+def normalize_lines(text):
+    """Non-empty lines with runs of whitespace collapsed, so layout noise does not show as a change"""
+    return [" ".join(line.split()) for line in (text or "").splitlines() if line.strip()]
+
+
+def split_value_line(line):
+    """(label, value, rest) for a measurement line like "HbA1c 7.4 % 4.0 - 5.6", else None"""
+    tokens = line.split()
+    for i in range(1, len(tokens)):
+        if NUMBER_RE.fullmatch(tokens[i].rstrip(",")):
+            label = " ".join(tokens[:i]).rstrip(":=- ")
+            if not any(ch.isalpha() for ch in label):
+                return None
+            return label, tokens[i].rstrip(","), " ".join(tokens[i + 1:])
+    return None
+
+
+def extract_values(text):
+    """{label key: (label, value)} for every measurement line of a report; the first occurrence wins"""
+    values = {}
+    for line in normalize_lines(text):
+        parsed = split_value_line(line)
+        if parsed:
+            values.setdefault(parsed[0].lower(), (parsed[0], parsed[1]))
+    return values
+
+
+def similarity(previous_text, current_text):
+    return difflib.SequenceMatcher(
+        None, normalize_lines(previous_text), normalize_lines(current_text), autojunk=False
+    ).ratio()
+
+
+def report_delta(previous_text, current_text, context=1):
+    """Lines of `current_text` that differ from `previous_text`.
+
+    Changed measurements are paired by label ("HbA1c: 7.4 -> 6.9 (% 4.0 - 5.6)"),
+    other new lines are prefixed "+ " and dropped ones "- ". Up to `context`
+    unchanged lines before each change are kept, prefixed "  ". Returns "" when
+    nothing changed and None when the reports are too different to diff.
+    """
+    previous_lines = normalize_lines(previous_text)
+    current_lines = normalize_lines(current_text)
+    matcher = difflib.SequenceMatcher(None, previous_lines, current_lines, autojunk=False)
+    if matcher.ratio() < MIN_SIMILARITY:
+        return None
+
+    output = []
+    shown_context = set()
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        for j in range(max(0, j1 - context), j1):
+            if j not in shown_context:
+                shown_context.add(j)
+                output.append(f"  {current_lines[j]}")
+
+        removed = previous_lines[i1:i2]
+        removed_values = {}
+        for line in removed:
+            parsed = split_value_line(line)
+            if parsed:
+                removed_values.setdefault(parsed[0].lower(), (parsed[1], line))
+        paired = set()
+        for line in current_lines[j1:j2]:
+            parsed = split_value_line(line)
+            old = removed_values.get(parsed[0].lower()) if parsed else None
+            if old and old[1] not in paired:
+                paired.add(old[1])
+                label, value, rest = parsed
+                output.append(f"{label}: {old[0]} -> {value}" + (f" ({rest})" if rest else ""))
+            else:
+                output.append(f"+ {line}")
+        output.extend(f"- {line}" for line in removed if line not in paired)
+    return "\n".join(output)
+
+
+def value_trends(report_text, previous_reports):
+    """Lines "label: oldest -> ... -> current" for measurements of this report that changed over the older ones.
+
+    `previous_reports` are texts newest first, as the apps pass them.
+    """
+    current = extract_values(report_text)
+    history = [extract_values(text) for text in reversed(previous_reports)]
+    trends = []
+    for key, (label, value) in current.items():
+        earlier = [values[key][1] for values in history if key in values]
+        if earlier and any(v != value for v in earlier):
+            trends.append(f"{label}: {' -> '.join(earlier + [value])}")
+    return "\n".join(trends)
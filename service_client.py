@@ -0,0 +1,53 @@
+import base64
+import json
+import time
+import urllib.error
+import urllib.request
+
+
+class ProcessingError(Exception):
+    """A processing job failed or could not be submitted"""
+
+
+class ProcessingClient:
+    """Talks to processing_service.py over HTTP"""
+
+    def __init__(self, base_url, timeout=10.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, method, path, payload=None):
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        request = urllib.request.Request(f"{self.base_url}{path}", data=body, method=method,
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            detail = e.read().decode("utf-8", "replace")
+            raise ProcessingError(f"{method} {path} returned {e.code}: {detail}") from e
+        except urllib.error.URLError as e:
+            raise ProcessingError(f"Processing service unreachable: {e.reason}") from e
+
+    def submit(self, kind, pdf_bytes, **params):
+        """Queue a job and return its id"""
+        payload = dict(params, kind=kind, pdf_base64=base64.b64encode(pdf_bytes).decode("ascii"))
+        return self._request("POST", "/jobs", payload)["id"]
+
+    def status(self, job_id):
+        return self._request("GET", f"/jobs/{job_id}")
+
+    def wait(self, job_id, timeout=300.0, poll_interval=0.5):
+        """Poll until the job finishes and return its result"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            job = self.status(job_id)
+            if job["status"] == "done":
+                return job["result"]
+            if job["status"] == "failed":
+                raise ProcessingError(job["error"])
+            time.sleep(poll_interval)
+        raise ProcessingError(f"Job {job_id} did not finish within {timeout:.0f}s")
+
+    def run(self, kind, pdf_bytes, timeout=300.0, **params):
+        return self.wait(self.submit(kind, pdf_bytes, **params), timeout=timeout)
@@ -0,0 +1,144 @@
+"""Stress harness for the redaction regexes.
+
+Times every pattern from redaction_rules on pathological inputs of growing size
+and exits non-zero if any of them grows faster than linearly:
+
+    python stress_redaction.py
+    python stress_redaction.py --base-size 50000 --steps 4 --max-exponent 1.3
+
+Each size is timed over enough passes to add up to several milliseconds, the
+exponent is a least-squares fit over all sizes, and it is normalised against a
+linear reference scan of the same inputs.
+"""
+import argparse
+import math
+import random
+import re
+import sys
+import time
+
+from redaction_rules import all_patterns
+
+# Repeated units that drive backtracking in naive versions of the rules:
+# long digit/space runs, long words, dotted words, title words, separators, ...
+PATHOLOGICAL_UNITS = [
+    "1", "1 ", "1-", "a", "A", "a.", "a@", "a@a.", "a.a@", "Aa ", "Dr ", "Dr Aa ",
+    "Mr Aa ", "Me.Aa ", "ID ", "ID:", "Age ", "age:", "Patient ", "www.", "http://",
+    "Tab ", "tab. ", "aaaa 1", "12mg", "pain", "paint ", "a-", " ", ":\n",
+]
+
+
+def garbled(size, seed=7):
+    """OCR-style noise: letters, digits and punctuation with few line breaks"""
+    rng = random.Random(seed)
+    alphabet = "aAbBdDrRmM1234567890 .:-@/\t"
+    return "".join(rng.choice(alphabet) for _ in range(size))
+
+
+def make_input(unit, size):
+    if unit is None:
+        return garbled(size)
+    return (unit * (size // len(unit) + 1))[:size]
+
+
+# A scan that visits every position and never matches: linear by construction.
+# Each rule is timed back to back with it on the same input, so cache effects
+# that grow with the input cancel out of the exponent.
+REFERENCE_SCAN = re.compile(r"[\x00\x01]{2}")
+
+
+def best_pass(pattern, text, min_time, min_passes=5):
+    """Fastest single finditer pass over `text`, repeating passes until they total `min_time`.
+
+    The minimum of many passes rather than one long timed loop, so a pass that
+    was descheduled or throttled does not count.
+    """
+    best = float("inf")
+    total = 0.0
+    passes = 0
+    while total < min_time or passes < min_passes:
+        start = time.thread_time()
+        for _ in pattern.finditer(text):
+            pass
+        elapsed = time.thread_time() - start
+        best = min(best, elapsed)
+        total += elapsed
+        passes += 1
+    return best
+
+
+def measure(pattern, inputs, min_time):
+    """(pass time, pass time relative to REFERENCE_SCAN) on each input"""
+    timings, ratios = [], []
+    for text in inputs:
+        best = best_pass(pattern, text, min_time)
+        timings.append(best)
+        ratios.append(best / best_pass(REFERENCE_SCAN, text, min_time))
+    return timings, ratios
+
+
+def growth_exponent(sizes, timings):
+    """Least-squares slope of log(time) against log(size) over all sizes"""
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(t, 1e-12)) for t in timings]
+    mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+    return (sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+            / sum((x - mean_x) ** 2 for x in xs))
+
+
+def rule_exponent(pattern, sizes, inputs, min_time):
+    """(growth exponent relative to the linear reference, pass timings) of `pattern` over `inputs`"""
+    timings, ratios = measure(pattern, inputs, min_time)
+    # The reference itself grows linearly, so a flat ratio is exponent 1
+    return 1.0 + growth_exponent(sizes, ratios), timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-size", type=int, default=20000, help="smallest input, in characters")
+    parser.add_argument("--steps", type=int, default=4, help="number of doublings of the input size")
+    parser.add_argument("--max-exponent", type=float, default=1.4,
+                        help="fail if time grows faster than size**max_exponent (1.0 is linear)")
+    parser.add_argument("--min-time", type=float, default=5e-3,
+                        help="repeat passes over each input until they total this long, in seconds")
+    parser.add_argument("--retries", type=int, default=2, help="re-measure a rule this many times before failing it")
+    args = parser.parse_args()
+
+    sizes = [args.base_size * 2 ** i for i in range(args.steps)]
+    failures = []
+    worst = {}
+
+    units = PATHOLOGICAL_UNITS + [None]
+    inputs = {unit: [make_input(unit, size) for size in sizes] for unit in units}
+
+    for name, pattern in all_patterns():
+        for unit in units:
+            exponent, timings = rule_exponent(pattern, sizes, inputs[unit], args.min_time)
+            for _ in range(args.retries):
+                if exponent <= args.max_exponent:
+                    break
+                # Real backtracking is super-linear on every run; noise is not
+                exponent, timings = min((exponent, timings), rule_exponent(pattern, sizes, inputs[unit], args.min_time))
+            if exponent > worst.get(name, (0.0, None))[0]:
+                worst[name] = (exponent, unit, timings[-1])
+            if exponent > args.max_exponent:
+                failures.append((name, unit, exponent, timings))
+
+    print(f"{'rule':<18} {'worst exponent':>14} {'time @ ' + str(sizes[-1]):>14}  input unit")
+    for name, _ in all_patterns():
+        exponent, unit, slowest = worst.get(name, (0.0, "-", 0.0))
+        label = "garbled" if unit is None else repr(unit)
+        print(f"{name:<18} {exponent:>14.2f} {slowest * 1000:>12.2f}ms  {label}")
+
+    if failures:
+        print("\nSuper-linear rules:")
+        for name, unit, exponent, timings in failures:
+            label = "garbled" if unit is None else repr(unit)
+            print(f"  {name} on {label}: exponent {exponent:.2f}, timings {[round(t * 1000, 2) for t in timings]}ms")
+        return 1
+    print("\nAll rules scale linearly.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
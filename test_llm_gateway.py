@@ -0,0 +1,107 @@
+"""LLMGateway against the local fake server (fake_llm_server.py).
+
+    python -m pytest -q test_llm_gateway.py
+"""
+import json
+import threading
+import time
+import urllib.request
+
+import pytest
+
+from fake_llm_server import start_server
+from llm_gateway import HttpBackend, LLMGateway, LLMTimeoutError, RateLimitError
+
+
+@pytest.fixture
+def fake_llm():
+    servers = []
+
+    def start(**options):
+        server = start_server(port=0, jitter=0.0, **options)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def requests_served(server):
+    with urllib.request.urlopen(url(server), timeout=5) as response:
+        return json.loads(response.read())["requests"]
+
+
+def make_gateway(server, **options):
+    options = dict(dict(rate=100.0, burst=100, timeout=10.0, backoff_base=0.01, backoff_cap=0.05), **options)
+    return LLMGateway(HttpBackend(url(server)), **options)
+
+
+def test_identical_prompts_are_coalesced(fake_llm):
+    server = fake_llm(latency=0.5)
+    gateway = make_gateway(server)
+    results = []
+
+    def call():
+        results.append(gateway.generate("same prompt"))
+
+    threads = [threading.Thread(target=call) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 5 and len(set(results)) == 1
+    assert requests_served(server) == 1
+    assert gateway.stats["calls"] == 1
+    assert gateway.stats["coalesced"] == 4
+
+
+def test_different_prompts_are_not_coalesced(fake_llm):
+    server = fake_llm(latency=0.0)
+    gateway = make_gateway(server)
+    gateway.generate("first prompt")
+    gateway.generate("second prompt")
+    assert requests_served(server) == 2
+    assert gateway.stats["coalesced"] == 0
+
+
+def test_deadline_raises_timeout(fake_llm):
+    server = fake_llm(latency=3.0)
+    gateway = make_gateway(server, max_retries=0)
+    start = time.monotonic()
+    with pytest.raises(LLMTimeoutError):
+        gateway.generate("slow prompt", timeout=0.5)
+    assert time.monotonic() - start < 2.0
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_retries_rate_limits_and_unavailable(fake_llm, status):
+    server = fake_llm(latency=0.0, script=[(0.0, status), (0.0, status)])
+    gateway = make_gateway(server, max_retries=3)
+    assert gateway.generate("retry me").startswith("Fake answer")
+    assert requests_served(server) == 3
+    assert gateway.stats["retries"] == 2
+
+
+def test_gives_up_after_max_retries(fake_llm):
+    server = fake_llm(latency=0.0, script=[(0.0, 429)] * 3)
+    gateway = make_gateway(server, max_retries=1)
+    with pytest.raises(RateLimitError):
+        gateway.generate("always limited")
+    assert requests_served(server) == 2
+
+
+def test_slow_call_is_hedged(fake_llm):
+    server = fake_llm(latency=0.0, script=[(3.0, 200)])
+    gateway = make_gateway(server, hedge_after=0.2)
+    start = time.monotonic()
+    assert gateway.generate("hedge me").startswith("Fake answer")
+    assert time.monotonic() - start < 2.0
+    assert gateway.stats["hedges"] == 1
+    assert gateway.stats["calls"] == 2